@@ -1,33 +1,117 @@
+from array import array
 from enum import Enum, auto
-from typing import Literal
+from dataclasses import dataclass
+from typing import IO, Iterator, Literal
 from chess_pieces import Piece
 from chess_pieces import King
 from chess_pieces import Rook
 from chess_pieces import Pawn
+from chess_pieces import Knight
+from chess_pieces import Bishop
+from chess_pieces import Queen
+from chess_pieces import STANDARD_PIECES, ORTHOGONAL, DIAGONAL, KNIGHT_TARGETS, RAYS, PAWN_CAPTURES
 from utils.Vec2 import Vec2
+from chess_bitboard import Bitboards, SQUARES, TEAM_INDEX, KIND_INDEX, PAWN, KING, square_index, iter_bits
+from chess_zobrist import piece_key, SIDE_KEY, CASTLING_KEYS, EN_PASSANT_KEYS
+from chess_fen import Fen, parse_fen, format_fen, read_positions
+from chess_eval import piece_scores, tapered
+from chess_move import Move, encode, decode, move_list, QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EN_PASSANT, PROMOTION, PROMOTION_PIECES, PROMOTION_FLAGS
 import exceptions
 
 #FEN_notation = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR"
 
+PROMOTIONS: tuple[Literal["Q", "R", "B", "N"], ...] = ("Q", "R", "B", "N")
+
+#(castling rights bit, team, king square, rook square)
+CASTLING = (
+    (1, "WHITE", Vec2(5, 1), Vec2(8, 1)),
+    (2, "WHITE", Vec2(5, 1), Vec2(1, 1)),
+    (4, "BLACK", Vec2(5, 8), Vec2(8, 8)),
+    (8, "BLACK", Vec2(5, 8), Vec2(1, 8)),
+)
+
+#castling rights left after a move from or to the square, a1 = 0 ... h8 = 63
+CASTLING_MASKS = [15] * 64
+for _bit, _team, _king_pos, _rook_pos in CASTLING:
+    CASTLING_MASKS[square_index(_king_pos)] &= ~_bit
+    CASTLING_MASKS[square_index(_rook_pos)] &= ~_bit
+
 class GameStatus(Enum):
     ONGOING = auto()
     CHECK = auto()
     CHECKMATE = auto()
     STALEMATE = auto()
+    THREEFOLD_REPETITION = auto()
+    FIFTY_MOVES = auto()
 
     PROMOTING = auto()
 
+#statuses that end the game, only mate and stalemate leave no move to play
+GAME_OVER = (GameStatus.CHECKMATE, GameStatus.STALEMATE, GameStatus.THREEFOLD_REPETITION, GameStatus.FIFTY_MOVES)
+
+@dataclass(slots=True)
+class UndoRecord:
+    """Everything make_move changes that can't be recomputed from the move itself"""
+    move: Move
+    pos_1: Vec2
+    pos_2: Vec2
+    piece: Piece
+    team: Literal["WHITE", "BLACK"]
+    status: "GameStatus"
+    last_move: tuple[Vec2, Vec2] | None #(from, to) of the previous move, it decides en passant
+    halfmove_clock: int
+    captured: Piece | None = None
+    captured_pos: Vec2 | None = None
+    rook_move: tuple[Vec2, Vec2] | None = None #castling
+    promotion: Piece | None = None
+    key: int = 0 #zobrist key before the move
+    castling: int = 0 #castling rights mask before the move
+    move_table: dict[Vec2, list[Vec2]] | None = None #legal moves of the position before the move
+
+@dataclass(slots=True)
+class BoardChange:
+    """One edit a view has to make to its copy of the board"""
+    kind: Literal["move", "remove", "add"]
+    pos: Vec2 #square a piece leaves, is taken from or is put on
+    to: Vec2 | None = None #destination of a move
+    piece: Piece | None = None #piece put on pos by an add
+
 class Chess():
-    def __init__(self, fen_notation: str):
-        self.board: dict[Vec2, Piece] = self._create_board(fen_notation)
-        self.current_team: Literal["WHITE", "BLACK"] = "WHITE"
+    def __init__(self, fen_notation: str | Fen, backend: Literal["dict", "bitboard"] = "dict"):
+        """fen_notation is a full FEN, its placement field alone, or a Fen already parsed by chess_fen"""
+        state = parse_fen(fen_notation) if isinstance(fen_notation, str) else fen_notation
+        self.board: dict[Vec2, Piece] = dict(state.board)
+        self.current_team: Literal["WHITE", "BLACK"] = state.team
 
-        self.last_move: tuple[Vec2, Vec2] | None = None #en passant
+        #the dict board is always kept, the bitboards mirror it and take over move generation
+        self.bitboards: Bitboards | None = self._create_bitboards(self.board) if backend == "bitboard" else None
+
+        self.last_move: tuple[Vec2, Vec2] | None = self._get_en_passant_move(state.en_passant) #en passant
+        self.halfmove_clock = state.halfmove_clock #plies since the last capture or pawn move
+        self.fullmove_number = state.fullmove_number
+        self.history: list[UndoRecord] = [] #undo stack
+        self._move_table: dict[Vec2, list[Vec2]] | None = None #see get_move_table
 
         self.promoting_pawn_pos: Vec2 | None = None
         self.promoting_team: Literal["WHITE", "BLACK"] | None = None
 
+        #position key, updated incrementally by every board write and by make/unmake
+        #CASTLING bits, rights without their king and rook on the home squares are dropped
+        self.castling_rights = self._get_castling_rights()
+        if state.castling_rights is not None:
+            self.castling_rights &= state.castling_rights
+        self.zobrist_key = self._compute_zobrist_key()
+
+        #running material + piece-square totals (white minus black) and game phase, kept by every board write
+        self.mg_score, self.eg_score, self.phase = self._compute_evaluation()
+
+        #keys of every position of the game, the counts make repetition an O(1) lookup
+        self.key_history: list[int] = [self.zobrist_key]
+        self.key_counts: dict[int, int] = {self.zobrist_key: 1}
+
+        self.status = GameStatus.ONGOING
         self.status = self._board_status()
+        self.start_fen = self.fen() #history replays from here
 
 
         # self._print_board(self.board)
@@ -36,6 +120,7 @@ class Chess():
 
     def move(self, pos_1: Vec2, pos_2: Vec2): 
         """pos_1 is the piece to move, pos_2 is where to move"""
+        #repetition and fifty-move draws stop the frontends, but a recorded game that played on still replays
         if self.status in (GameStatus.CHECKMATE, GameStatus.STALEMATE):
             raise exceptions.GameEnded("Game is already over")
         if self.status == GameStatus.PROMOTING:
@@ -58,66 +143,101 @@ class Chess():
         
         #----------------------------------------------------
 
-        #castling (move rooks)
-        if isinstance(piece, King) and abs(pos_2.x - pos_1.x) == 2:
-            rook_x = 8 if pos_2.x > pos_1.x else 1
-            rook_dest_x = pos_2.x - 1 if pos_2.x > pos_1.x else pos_2.x + 1
-            rook_pos = Vec2(rook_x, pos_1.y)
-            self.board[Vec2(rook_dest_x, pos_1.y)] = self.board.pop(rook_pos)
-
-        #en Passant capturing
-        if isinstance(piece, Pawn) and pos_1.x != pos_2.x and pos_2 not in self.board:
-            self.board.pop(Vec2(pos_2.x, pos_1.y), None)
+        self.make_move(encode(square_index(pos_1), square_index(pos_2), self._get_move_flags(pos_1, pos_2, piece)))
 
-        self.board[pos_2] = self.board.pop(pos_1)
-
-        if isinstance(piece, (King, Rook)):
-            piece.moved = True
-            
         last_rank = 8 if piece.team == "WHITE" else 1
         if isinstance(piece, Pawn) and  pos_2.y == last_rank:
+            #the turn passes in promote()
+            self.current_team = piece.team
+            self._move_table = None
             self.status = GameStatus.PROMOTING
             self.promoting_pawn_pos = pos_2
             self.promoting_team = piece.team
             return
 
-        self.last_move = (pos_1, pos_2)
-        self.current_team = self._enemy(self.current_team)
         self.status = self._board_status()
 
     def get_piece_moves(self, pos: Vec2) -> list[Vec2]: 
         """Returns the legal moves for the piece"""
-        piece = self.board.get(pos)
-        if not piece or piece.team != self.current_team:
-            return []
-        
-        moves = piece.get_moves(pos, self.board)
-        legal_moves = []
+        return list(self.get_move_table().get(pos, ()))
 
-        #castling pseudo-moves
-        if isinstance(piece, King) and not piece.moved:
-            if not self._is_in_check(self.board, self.current_team):
-                moves.extend(self._get_castle_moves(piece, pos))
+    def get_move_table(self) -> dict[Vec2, list[Vec2]]:
+        """Legal destinations of every movable piece of the current team, computed once per position"""
+        if self._move_table is None:
+            self._move_table = {pos: moves for pos, _, moves in self._iter_legal_piece_moves() if moves}
+        return self._move_table
+    
+    def fen(self) -> str:
+        """Full six field FEN of the position"""
+        ep_square = None
+        if self.last_move and isinstance(self.board.get(self.last_move[1]), Pawn):
+            last_start, last_end = self.last_move
+            if abs(last_start.y - last_end.y) == 2:
+                ep_square = Vec2(last_end.x, (last_start.y + last_end.y) // 2)
+        return format_fen(self.board, self.current_team, self.castling_rights, ep_square, self.halfmove_clock, self.fullmove_number)
+
+    def evaluate(self) -> int:
+        """Static evaluation in centipawns for the side to move, read from the running totals"""
+        score = tapered(self.mg_score, self.eg_score, self.phase)
+        return score if self.current_team == "WHITE" else -score
+
+    def repetitions(self) -> int:
+        """How often the current position has occurred in the game, this time included"""
+        return self.key_counts.get(self.zobrist_key, 0)
+
+    def is_in_check(self) -> bool:
+        """True if the current team's king is attacked"""
+        return self._is_in_check(self.board, self.current_team)
+
+    def get_legal_moves(self) -> array:
+        """Returns every legal move of the current team packed as in chess_move"""
+        moves = move_list()
+        last_rank = 8 if self.current_team == "WHITE" else 1
+
+        #search and perft see most positions once, so the table is only read when it already exists
+        if self._move_table is None and self.bitboards is not None:
+            return self._get_bitboard_legal_moves()
+        if self._move_table is not None:
+            piece_moves = ((pos, self.board[pos], targets) for pos, targets in self._move_table.items())
+        else:
+            piece_moves = self._iter_legal_piece_moves()
+
+        for pos, piece, targets in piece_moves:
+            from_sq = square_index(pos)
+            is_pawn = isinstance(piece, Pawn)
+            for move in targets:
+                flags = self._get_move_flags(pos, move, piece)
+                if is_pawn and move.y == last_rank:
+                    moves.extend(encode(from_sq, square_index(move), flags | PROMOTION_FLAGS[promotion]) for promotion in PROMOTIONS)
+                else:
+                    moves.append(encode(from_sq, square_index(move), flags))
+        return moves
 
-        if isinstance(piece, Pawn):
-            moves.extend(self._get_en_passant_moves(pos, piece))
-        
-        #handles: can the piece checking the king be captured or blocked, avoids reveal checks
-        for move in moves:
-            if isinstance(piece, King) and abs(move.x - pos.x) == 2:
-                #is king and castle
-                step = 1 if move.x > pos.x else -1
-                path = [Vec2(pos.x + step, pos.y), Vec2(pos.x + 2 * step, pos.y)]
+    def perft(self, depth: int) -> int:
+        """Counts the leaf nodes of the legal move tree depth plies deep"""
+        if depth <= 0:
+            return 1
 
-                if any(self._is_square_attacked(self.board, sq, self.current_team) for sq in path):
-                    continue
+        moves = self.get_legal_moves()
+        if depth == 1:
+            return len(moves)
 
-            board_copy = self._simulate_move(self.board, pos, move)
-            if not self._is_in_check(board_copy, self.current_team):
-                legal_moves.append(move)
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+    def divide(self, depth: int) -> dict[Move, int]:
+        """perft split by root move"""
+        result = {}
+        for move in self.get_legal_moves():
+            self.make_move(move)
+            result[move] = self.perft(depth - 1)
+            self.unmake_move()
+        return result
 
-        return legal_moves #returns the moves that doesnt get the king in check
-    
     def promote(self, piece_type: Literal["Q", "R", "B", "N"]):
         if self.status != GameStatus.PROMOTING:
             raise exceptions.InvalidMove("No pawn to promote")
@@ -126,7 +246,7 @@ class Chess():
             self.status = GameStatus.ONGOING
             raise exceptions.InvalidMove("Position or team not found for pawn to promote")
         
-        if piece_type not in ("Q", "R", "B", "N"):
+        if piece_type not in PROMOTIONS:
             raise exceptions.InvalidInput("Invalid promotion piece")
         
         pos, team = self.promoting_pawn_pos, self.promoting_team
@@ -135,19 +255,324 @@ class Chess():
         if piece is None:
             raise exceptions.InvalidInput("Invalid piece to promote") #should never trigger
             
-        del self.board[pos]
-        self.board[pos] = piece
+        self._remove_piece(pos)
+        self._set_piece(pos, piece)
+        self.history[-1].promotion = piece
+        self.history[-1].move |= PROMOTION_FLAGS[piece_type] << 12
+        self._pop_key()
+        self._push_key()
     
         self.promoting_pawn_pos = self.promoting_team = None
     
         self.current_team = self._enemy(team)
+        self._move_table = None
         self.status = self._board_status()
 
+    def play(self, move: Move):
+        """Plays a packed move through move and promote, validated like a move from the board"""
+        pos_1, pos_2, promotion = decode(move)
+        self.move(pos_1, pos_2)
+        if self.status == GameStatus.PROMOTING:
+            self.promote(promotion or "Q")
+
+    def last_changes(self) -> list[BoardChange]:
+        """Board edits of the last move in the order to apply them: capture, castling rook, the move, promotion"""
+        if not self.history:
+            return []
+        record = self.history[-1]
+        changes = []
+        if record.captured_pos is not None:
+            changes.append(BoardChange("remove", record.captured_pos))
+        if record.rook_move is not None:
+            changes.append(BoardChange("move", *record.rook_move))
+        changes.append(BoardChange("move", record.pos_1, record.pos_2))
+        if record.promotion is not None:
+            changes.append(BoardChange("remove", record.pos_2))
+            changes.append(BoardChange("add", record.pos_2, piece=record.promotion))
+        return changes
+
     def undo(self):
-        pass
+        """Takes back the last move, a pending promotion included"""
+        if not self.history:
+            raise exceptions.InvalidMove("No move to undo")
+
+        record = self.unmake_move()
+        self.promoting_pawn_pos = self.promoting_team = None
+        self.status = record.status
+
+    def make_move(self, move: Move) -> UndoRecord:
+        """Plays the move in place without validating it or updating the status, unmake_move takes it back"""
+        from_sq, to_sq, flags = move & 0x3F, move >> 6 & 0x3F, move >> 12
+        pos_1, pos_2 = SQUARES[from_sq], SQUARES[to_sq]
+        piece = self.board[pos_1]
+        record = UndoRecord(move, pos_1, pos_2, piece, self.current_team, self.status, self.last_move, self.halfmove_clock,
+                            key=self.zobrist_key, castling=self.castling_rights, move_table=self._move_table)
+        self._move_table = None
+        self.zobrist_key ^= self._get_state_key()
+
+        #castling (move rooks)
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook_pos, rook_dest = (SQUARES[to_sq + 1], SQUARES[to_sq - 1]) if flags == KING_CASTLE else (SQUARES[to_sq - 2], SQUARES[to_sq + 1])
+            self._set_piece(rook_dest, self._remove_piece(rook_pos))
+            record.rook_move = (rook_pos, rook_dest)
+
+        if flags & CAPTURE:
+            #en passant takes the pawn beside the mover, on the file it moves to
+            record.captured_pos = SQUARES[from_sq & ~7 | to_sq & 7] if flags == EN_PASSANT else pos_2
+            record.captured = self._remove_piece(record.captured_pos)
+
+        self._remove_piece(pos_1)
+        if flags & PROMOTION:
+            record.promotion = Piece.create_piece(PROMOTION_PIECES[flags & 3], piece.team)
+        self._set_piece(pos_2, record.promotion or piece)
+
+        self.castling_rights &= CASTLING_MASKS[from_sq] & CASTLING_MASKS[to_sq]
+
+        self.halfmove_clock = 0 if flags & CAPTURE or isinstance(piece, Pawn) else self.halfmove_clock + 1
+        if self.current_team == "BLACK":
+            self.fullmove_number += 1
+
+        self.last_move = (pos_1, pos_2)
+        self.current_team = self._enemy(self.current_team)
+        self.zobrist_key ^= self._get_state_key()
+        self.history.append(record)
+        self._push_key()
+        return record
+
+    def unmake_move(self) -> UndoRecord:
+        """Restores the position before the last make_move, status included"""
+        record = self.history.pop()
+        self._pop_key()
+
+        self._remove_piece(record.pos_2)
+        self._set_piece(record.pos_1, record.piece)
+
+        if record.captured is not None and record.captured_pos is not None:
+            self._set_piece(record.captured_pos, record.captured)
+
+        if record.rook_move is not None:
+            rook_pos, rook_dest = record.rook_move
+            self._set_piece(rook_pos, self._remove_piece(rook_dest))
+
+        self.last_move = record.last_move
+        self.halfmove_clock = record.halfmove_clock
+        if record.team == "BLACK":
+            self.fullmove_number -= 1
+        self.current_team = record.team
+        self.status = record.status
+        self.castling_rights = record.castling
+        self.zobrist_key = record.key
+        self._move_table = record.move_table
+        return record
     
     #======================PRIVATE METHODS======================
 
+    def _get_move_filter(self, team: Literal["WHITE", "BLACK"]) -> tuple | None:
+        """checkers and pins of the team, computed once per position and shared by all its pieces"""
+        if self.bitboards is not None:
+            return self.bitboards.move_filter(TEAM_INDEX[team])
+        return self._get_dict_move_filter(team)
+
+    def _get_legal_piece_moves(self, pos: Vec2, piece: Piece, move_filter: tuple | None) -> list[Vec2]:
+        if self.bitboards is not None:
+            return self._get_bitboard_moves(pos, piece, move_filter) # type: ignore
+        return self._get_dict_moves(pos, piece, move_filter)
+
+    def _get_bitboard_moves(self, pos: Vec2, piece: Piece, move_filter: tuple[int, int, dict[int, int]]) -> list[Vec2]:
+        bitboards = self.bitboards
+        assert bitboards is not None
+
+        legal_moves = [SQUARES[target] for target in iter_bits(bitboards.legal_targets(square_index(pos), move_filter))]
+        legal_moves.extend(self._get_bitboard_special_moves(pos, piece, move_filter))
+        return legal_moves
+
+    def _get_bitboard_special_moves(self, pos: Vec2, piece: Piece, move_filter: tuple[int, int, dict[int, int]]) -> list[Vec2]:
+        """legal en passant and castling moves, the bitboard targets leave them out"""
+        bitboards = self.bitboards
+        assert bitboards is not None
+        team = TEAM_INDEX[piece.team]
+        sq = square_index(pos)
+        legal_moves = []
+
+        if isinstance(piece, Pawn):
+            for move in self._get_en_passant_moves(pos, piece):
+                captured = square_index(Vec2(move.x, pos.y))
+                if not bitboards.exposes_king(team, sq, square_index(move), captured):
+                    legal_moves.append(move)
+
+        checkers = move_filter[0]
+        if isinstance(piece, King) and not checkers:
+            for move in self._get_castle_moves(piece, pos):
+                step = 1 if move.x > pos.x else -1
+                path = (Vec2(pos.x + step, pos.y), move)
+                if not any(bitboards.is_attacked(square_index(sq), team ^ 1) for sq in path):
+                    legal_moves.append(move)
+
+        return legal_moves
+
+    def _get_bitboard_legal_moves(self) -> array:
+        """packed moves straight from the target bitboards, only en passant and castling go through Vec2"""
+        bitboards = self.bitboards
+        assert bitboards is not None
+        team = TEAM_INDEX[self.current_team]
+        move_filter = bitboards.move_filter(team)
+        enemies = bitboards.occupied[team ^ 1]
+        moves = move_list()
+
+        for from_sq in iter_bits(bitboards.occupied[team]):
+            kind = bitboards.mailbox[from_sq][1] # type: ignore
+            for to_sq in iter_bits(bitboards.legal_targets(from_sq, move_filter)):
+                flags = CAPTURE if enemies >> to_sq & 1 else QUIET
+                if kind == PAWN:
+                    if to_sq >= 56 or to_sq < 8:
+                        moves.extend(encode(from_sq, to_sq, flags | PROMOTION_FLAGS[promotion]) for promotion in PROMOTIONS)
+                        continue
+                    if abs(to_sq - from_sq) == 16:
+                        flags = DOUBLE_PUSH
+                moves.append(encode(from_sq, to_sq, flags))
+
+            if kind == PAWN or kind == KING:
+                pos = SQUARES[from_sq]
+                piece = self.board[pos]
+                for move in self._get_bitboard_special_moves(pos, piece, move_filter):
+                    moves.append(encode(from_sq, square_index(move), self._get_move_flags(pos, move, piece)))
+        return moves
+
+    def _get_dict_move_filter(self, team: Literal["WHITE", "BLACK"]) -> tuple[int, set[Vec2] | None, dict[Vec2, set[Vec2]]] | None:
+        """(number of checkers, squares that resolve the check, pin ray of every pinned piece)"""
+        enemy = self._enemy(team)
+        #custom enemy pieces don't follow lines, every move is verified with make/unmake instead
+        if any(piece.team == enemy and not isinstance(piece, STANDARD_PIECES) for piece in self.board.values()):
+            return None
+
+        king = self._get_king_pos(self.board, team)
+        checkers = self._get_attackers(king, enemy)
+
+        evasions: set[Vec2] | None = None
+        if len(checkers) == 1:
+            checker = checkers[0]
+            evasions = {checker}
+            if isinstance(self.board[checker], (Rook, Bishop, Queen)):
+                evasions.update(self._get_between(king, checker))
+        elif len(checkers) > 1:
+            evasions = set() #double check, only the king can move
+
+        return len(checkers), evasions, self._get_pins(king, team)
+
+    def _get_dict_moves(self, pos: Vec2, piece: Piece, move_filter: tuple[int, set[Vec2] | None, dict[Vec2, set[Vec2]]] | None) -> list[Vec2]:
+        if move_filter is None:
+            moves = piece.get_moves(pos, self.board)
+            if isinstance(piece, King) and not self._is_in_check(self.board, piece.team):
+                moves.extend(self._get_castle_moves(piece, pos))
+            if isinstance(piece, Pawn):
+                moves.extend(self._get_en_passant_moves(pos, piece))
+            return self._get_verified_moves(pos, piece, moves)
+
+        checkers, evasions, pins = move_filter
+        enemy = self._enemy(piece.team)
+
+        if isinstance(piece, King):
+            moves = piece.get_moves(pos, self.board)
+
+            #lifted so sliders keep attacking the squares behind the king
+            del self.board[pos]
+            legal_moves = [move for move in moves if not self._get_attackers(move, enemy)]
+            self.board[pos] = piece
+
+            if not checkers:
+                for move in self._get_castle_moves(piece, pos):
+                    step = 1 if move.x > pos.x else -1
+                    path = (Vec2(pos.x + step, pos.y), move)
+                    if not any(self._get_attackers(sq, enemy) for sq in path):
+                        legal_moves.append(move)
+            return legal_moves
+
+        if checkers > 1:
+            return []
+
+        pin = pins.get(pos)
+        legal_moves = [
+            move for move in piece.get_moves(pos, self.board)
+            if (evasions is None or move in evasions) and (pin is None or move in pin)
+        ]
+
+        #en passant removes a second piece from the board, rare enough to verify directly
+        if isinstance(piece, Pawn):
+            legal_moves.extend(self._get_verified_moves(pos, piece, self._get_en_passant_moves(pos, piece)))
+        return legal_moves
+
+    def _get_verified_moves(self, pos: Vec2, piece: Piece, moves: list[Vec2]) -> list[Vec2]:
+        """Plays every move to see if it leaves the king in check"""
+        legal_moves = []
+        for move in moves:
+            if isinstance(piece, King) and abs(move.x - pos.x) == 2:
+                #is king and castle
+                step = 1 if move.x > pos.x else -1
+                path = [Vec2(pos.x + step, pos.y), Vec2(pos.x + 2 * step, pos.y)]
+
+                if any(self._is_square_attacked(self.board, sq, piece.team) for sq in path):
+                    continue
+
+            self.make_move(encode(square_index(pos), square_index(move), self._get_move_flags(pos, move, piece)))
+            if not self._is_in_check(self.board, piece.team):
+                legal_moves.append(move)
+            self.unmake_move()
+
+        return legal_moves
+
+    def _get_attackers(self, square: Vec2, by_team: Literal["WHITE", "BLACK"]) -> list[Vec2]:
+        """pieces of by_team attacking the square, looked up from the square outwards"""
+        board = self.board
+        attackers = []
+
+        for pos in KNIGHT_TARGETS[square]:
+            piece = board.get(pos)
+            if isinstance(piece, Knight) and piece.team == by_team:
+                attackers.append(pos)
+
+        #a pawn attacks the square from where an enemy pawn on the square would capture
+        for pos in PAWN_CAPTURES[self._enemy(by_team)][square]:
+            piece = board.get(pos)
+            if isinstance(piece, Pawn) and piece.team == by_team:
+                attackers.append(pos)
+
+        rays = RAYS[square]
+        for directions, slider in ((ORTHOGONAL, Rook), (DIAGONAL, Bishop)):
+            for direction in directions:
+                for distance, pos in enumerate(rays[direction]):
+                    piece = board.get(pos)
+                    if piece is not None:
+                        if piece.team == by_team and (isinstance(piece, (slider, Queen)) or (distance == 0 and isinstance(piece, King))):
+                            attackers.append(pos)
+                        break
+
+        for pos, piece in board.items():
+            if piece.team == by_team and not isinstance(piece, STANDARD_PIECES) and square in piece.get_moves(pos, board):
+                attackers.append(pos)
+
+        return attackers
+
+    def _get_pins(self, king: Vec2, team: Literal["WHITE", "BLACK"]) -> dict[Vec2, set[Vec2]]:
+        """pinned pieces of the team and the squares they can still move to"""
+        pins: dict[Vec2, set[Vec2]] = {}
+
+        for directions, slider in ((ORTHOGONAL, Rook), (DIAGONAL, Bishop)):
+            for direction in directions:
+                ray: set[Vec2] = set()
+                pinned: Vec2 | None = None
+                for pos in RAYS[king][direction]:
+                    ray.add(pos)
+                    piece = self.board.get(pos)
+                    if piece is not None:
+                        if pinned is None and piece.team == team:
+                            pinned = pos
+                        else:
+                            if pinned is not None and piece.team != team and isinstance(piece, (slider, Queen)):
+                                pins[pinned] = ray
+                            break
+
+        return pins
+
     def _get_en_passant_moves(self, pos: Vec2, piece: Pawn) -> list[Vec2]:
             ep_moves = []
             if not self.last_move: return []
@@ -162,66 +587,167 @@ class Chess():
             return ep_moves
 
     def _get_castle_moves(self, king: King, pos: Vec2) -> list[Vec2]:
-        return king.castle(self.board)
+        rook_squares = [
+            rook_pos for bit, team, king_pos, rook_pos in CASTLING
+            if self.castling_rights & bit and team == king.team and king_pos == pos
+        ]
+        if not rook_squares:
+            return []
+        return king.castle(self.board, rook_squares)
     
-    #returns all of the legal moves for the team
-    def _get_all_legal_moves(self, board: dict[Vec2, Piece], team: Literal["WHITE", "BLACK"]) -> list[Vec2]:
-        moves = []
-        original_team = self.current_team
-        self.current_team = team
+    def _iter_legal_piece_moves(self):
+        """(pos, piece, legal moves) for every piece of the current team"""
+        move_filter = self._get_move_filter(self.current_team)
 
-        for pos, piece in board.items():
-            if piece.team == team:
-                moves.extend(self.get_piece_moves(pos))
-
-        self.current_team = original_team
-        return moves
-
-    #returns pseudo moves
-    @staticmethod
-    def _get_team_moves(board: dict[Vec2, Piece], team: Literal["WHITE", "BLACK"]) -> list[Vec2]:
-        all_moves = []
-        for pos, piece in board.items():
-            if piece.team == team:
-                all_moves.extend(piece.get_moves(pos, board))
-
-        return all_moves
+        #make_move reorders the dict while the moves are tested
+        for pos, piece in list(self.board.items()):
+            if piece.team == self.current_team:
+                yield pos, piece, self._get_legal_piece_moves(pos, piece, move_filter)
 
     #check if the team is in check
     def _is_in_check(self, board: dict[Vec2, Piece], team: Literal["WHITE", "BLACK"]) -> bool:
-        enemy = self._enemy(team)
+        if self.bitboards is not None:
+            return self.bitboards.in_check(TEAM_INDEX[team])
         king_pos = self._get_king_pos(board, team)
-        return king_pos in self._get_team_moves(board, enemy)
+        return bool(self._get_attackers(king_pos, self._enemy(team)))
     
-    def _is_king_in_checkmate(self, board: dict[Vec2, Piece], team: Literal["WHITE", "BLACK"]) -> bool:
-        king = self._get_king_pos(board, team)
-        king_moves = board[king].get_moves(king, board)
-        for moves in king_moves:
-            simulated_board = self._simulate_move(board, king, moves)
-            if not self._is_in_check(simulated_board, team):
-                return False
-        return True
-
     #======================HELPERS======================
+
+    def _push_key(self):
+        key = self.zobrist_key
+        self.key_history.append(key)
+        self.key_counts[key] = self.key_counts.get(key, 0) + 1
+
+    def _pop_key(self):
+        key = self.key_history.pop()
+        count = self.key_counts[key] - 1
+        if count:
+            self.key_counts[key] = count
+        else:
+            del self.key_counts[key]
+
+    def _get_move_flags(self, pos_1: Vec2, pos_2: Vec2, piece: Piece) -> int:
+        """chess_move flags of a move on the current board, promotions are added by the caller"""
+        flags = CAPTURE if pos_2 in self.board else QUIET
+        if isinstance(piece, Pawn):
+            if pos_1.x != pos_2.x and not flags:
+                return EN_PASSANT
+            if abs(pos_2.y - pos_1.y) == 2:
+                return DOUBLE_PUSH
+        elif isinstance(piece, King) and abs(pos_2.x - pos_1.x) == 2:
+            return KING_CASTLE if pos_2.x > pos_1.x else QUEEN_CASTLE
+        return flags
     
     def _board_status(self)-> GameStatus:
         in_check = self._is_in_check(self.board, self.current_team)
-        total_legal_moves = len(self._get_all_legal_moves(self.board, self.current_team))
-
-        if in_check and total_legal_moves == 0:
-            return GameStatus.CHECKMATE
-        elif not in_check and total_legal_moves == 0:
-            return GameStatus.STALEMATE
-        elif in_check and total_legal_moves != 0:
-            #check if the king can capture the piece that is attacking, if not then is a checkmate
-            if self._is_king_in_checkmate(self.board, self.current_team):
-                return GameStatus.CHECKMATE
-            return GameStatus.CHECK
-        return GameStatus.ONGOING
+
+        if not self._has_legal_move():
+            return GameStatus.CHECKMATE if in_check else GameStatus.STALEMATE
+        #a mate delivered on the hundredth ply still wins, so this comes after the legal move check
+        if self.halfmove_clock >= 100:
+            return GameStatus.FIFTY_MOVES
+        if self.repetitions() >= 3:
+            return GameStatus.THREEFOLD_REPETITION
+        return GameStatus.CHECK if in_check else GameStatus.ONGOING
+
+    def _has_legal_move(self) -> bool:
+        """stops at the first piece that can move, the full table is left for whoever needs it"""
+        if self._move_table is not None:
+            return bool(self._move_table)
+        return any(moves for _, _, moves in self._iter_legal_piece_moves())
 
     def _is_square_attacked(self, board: dict[Vec2, Piece], square: Vec2, team: Literal["WHITE", "BLACK"]) -> bool:
-        enemy = self._enemy(team)
-        return square in self._get_team_moves(board, enemy)
+        if self.bitboards is not None:
+            return self.bitboards.is_attacked(square_index(square), TEAM_INDEX[self._enemy(team)])
+        return bool(self._get_attackers(square, self._enemy(team)))
+
+    def _set_piece(self, pos: Vec2, piece: Piece):
+        """every board write goes through here so the bitboards and the zobrist key stay in sync"""
+        sq = square_index(pos)
+        old = self.board.get(pos)
+        if old is not None:
+            self.zobrist_key ^= piece_key(old, sq)
+            mg, eg, phase = piece_scores(old, sq)
+            self.mg_score -= mg
+            self.eg_score -= eg
+            self.phase -= phase
+        self.board[pos] = piece
+        self.zobrist_key ^= piece_key(piece, sq)
+        mg, eg, phase = piece_scores(piece, sq)
+        self.mg_score += mg
+        self.eg_score += eg
+        self.phase += phase
+
+        if self.bitboards is not None:
+            self.bitboards.put(sq, TEAM_INDEX[piece.team], KIND_INDEX[piece.abbreviation])
+
+    def _remove_piece(self, pos: Vec2) -> Piece:
+        piece = self.board.pop(pos)
+        sq = square_index(pos)
+        self.zobrist_key ^= piece_key(piece, sq)
+        mg, eg, phase = piece_scores(piece, sq)
+        self.mg_score -= mg
+        self.eg_score -= eg
+        self.phase -= phase
+        if self.bitboards is not None:
+            self.bitboards.remove(sq)
+        return piece
+
+    def _get_castling_rights(self) -> int:
+        """rights of a fresh placement, every king and rook still on its home square may castle"""
+        rights = 0
+        for bit, team, king_pos, rook_pos in CASTLING:
+            king, rook = self.board.get(king_pos), self.board.get(rook_pos)
+            if isinstance(king, King) and isinstance(rook, Rook) and king.team == rook.team == team:
+                rights |= bit
+        return rights
+
+    def _get_en_passant_file(self) -> int | None:
+        """file of the en passant square, only when an enemy pawn stands ready to take it"""
+        if not self.last_move:
+            return None
+        last_start, last_end = self.last_move
+        pawn = self.board.get(last_end)
+        if not isinstance(pawn, Pawn) or abs(last_start.y - last_end.y) != 2:
+            return None
+
+        for dx in (-1, 1):
+            neighbour = self.board.get(Vec2(last_end.x + dx, last_end.y))
+            if isinstance(neighbour, Pawn) and neighbour.team != pawn.team:
+                return last_end.x - 1
+        return None
+
+    def _get_state_key(self) -> int:
+        """zobrist part of everything but piece placement"""
+        key = CASTLING_KEYS[self.castling_rights]
+        if self.current_team == "BLACK":
+            key ^= SIDE_KEY
+        ep_file = self._get_en_passant_file()
+        if ep_file is not None:
+            key ^= EN_PASSANT_KEYS[ep_file]
+        return key
+
+    def _compute_zobrist_key(self) -> int:
+        key = self._get_state_key()
+        for pos, piece in self.board.items():
+            key ^= piece_key(piece, square_index(pos))
+        return key
+
+    def _compute_evaluation(self) -> tuple[int, int, int]:
+        mg = eg = phase = 0
+        for pos, piece in self.board.items():
+            piece_mg, piece_eg, piece_phase = piece_scores(piece, square_index(pos))
+            mg, eg, phase = mg + piece_mg, eg + piece_eg, phase + piece_phase
+        return mg, eg, phase
+
+    @staticmethod
+    def _create_bitboards(board: dict[Vec2, Piece]) -> Bitboards:
+        bitboards = Bitboards()
+        for pos, piece in board.items():
+            if piece.abbreviation not in KIND_INDEX:
+                raise exceptions.InvalidBoard(f"Bitboard backend does not support {piece!r}")
+            bitboards.put(square_index(pos), TEAM_INDEX[piece.team], KIND_INDEX[piece.abbreviation])
+        return bitboards
 
     @staticmethod
     def _get_king_pos(board: dict[Vec2, Piece], team: Literal["WHITE", "BLACK"]) -> Vec2:
@@ -231,44 +757,29 @@ class Chess():
         raise ValueError(f"No king found")
 
     @staticmethod
-    def _simulate_move(board: dict[Vec2, Piece], pos_1: Vec2, pos_2: Vec2) -> dict[Vec2, Piece]:
-        new_board = board.copy()
-        new_board[pos_2] = new_board.pop(pos_1)
-        return new_board
-    
+    def _get_between(pos_1: Vec2, pos_2: Vec2) -> list[Vec2]:
+        """squares strictly between two squares sharing a rank, file or diagonal"""
+        step_x = (pos_2.x > pos_1.x) - (pos_2.x < pos_1.x)
+        step_y = (pos_2.y > pos_1.y) - (pos_2.y < pos_1.y)
+        squares = []
+        x, y = pos_1.x + step_x, pos_1.y + step_y
+        while (x, y) != (pos_2.x, pos_2.y):
+            squares.append(Vec2(x, y))
+            x, y = x + step_x, y + step_y
+        return squares
+
     @staticmethod
     def _enemy(team: Literal["WHITE", "BLACK"]) -> Literal["WHITE", "BLACK"]:
         return "BLACK" if team == "WHITE" else "WHITE"
 
     @staticmethod
-    def _create_board(fen_notation: str) -> dict[Vec2, Piece]:
-        board: dict[Vec2, Piece] = {}
-        rows = fen_notation.split("/")
-        
-        if len(rows) != 8:
-            raise exceptions.InvalidBoard("Invalid FEN")
-    
-        for y_index, row in enumerate(rows):
-            x = 1
-            y = 8 - y_index
-    
-            for char in row:
-                if char.isdigit():
-                    x += int(char)
-                    continue
-                
-                team = "WHITE" if char.isupper() else "BLACK"
-                pos = Vec2(x, y)
-    
-                piece = Piece.create_piece(char, team)
+    def _get_en_passant_move(square: Vec2 | None) -> tuple[Vec2, Vec2] | None:
+        """the double push that left the FEN en passant square behind"""
+        if square is None:
+            return None
+        direction = 1 if square.y == 3 else -1
+        return Vec2(square.x, square.y - direction), Vec2(square.x, square.y + direction)
 
-                if piece:
-                    board[pos] = piece
-    
-                x += 1
-    
-        return board
-       
     #for debugging
     @staticmethod
     def _print_board(board):
@@ -284,3 +795,8 @@ class Chess():
             print(lol, " ".join(row))
             lol-=1
         print("  A B C D E F G H")
+
+def load_positions(source: str | IO[str], backend: Literal["dict", "bitboard"] = "dict") -> Iterator[tuple[Chess, dict[str, str]]]:
+    """A game for every line of a FEN or EPD file, with the EPD operations of the line"""
+    for state in read_positions(source):
+        yield Chess(state, backend), state.operations
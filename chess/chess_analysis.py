@@ -0,0 +1,96 @@
+import multiprocessing
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from chess_fen import STARTING_FEN
+from chess_move import Move
+from chess_search import Search, SearchResult
+import chess
+import chess_book
+import chess_tablebase
+
+#searches for a GUI in a worker process, the UI thread only submits positions and polls for results
+
+class Analyzer():
+    """One worker process searching one position at a time
+
+    Every start() is a new job and makes the previous one stop. poll() hands out the depths
+    the current job finished since the last call and its final result, results of jobs that
+    were replaced are dropped.
+    """
+    def __init__(self, book: str | None = None, tables: str | None = None):
+        self._updates = multiprocessing.Queue()
+        self._current = multiprocessing.Value("Q", 0, lock=False) #job the worker should be searching, 0 for none
+        self._pool = ProcessPoolExecutor(1, initializer=_init_worker, initargs=(self._updates, self._current, book, tables))
+        self._job = 0
+        self._future: Future | None = None
+
+    def start(self, game: chess.Chess, max_time: float | None = None, max_depth: int | None = None) -> int:
+        """Searches a copy of the position, returns the job number"""
+        self._job += 1
+        self._current.value = self._job
+        moves = [record.move for record in game.history]
+        self._future = self._pool.submit(_analyse, self._job, game.start_fen, moves, max_time, max_depth)
+        return self._job
+
+    def stop(self):
+        """Stops the current job, its result is dropped like the one of a replaced job"""
+        self._job += 1
+        self._current.value = 0
+
+    def poll(self) -> tuple[list[SearchResult], SearchResult | None]:
+        """(finished depths, final result or None while still searching) of the current job"""
+        updates = []
+        while True:
+            try:
+                job, result = self._updates.get_nowait()
+            except queue.Empty:
+                break
+            if job == self._job:
+                updates.append(result)
+
+        final = None
+        if self._future is not None and self._future.done():
+            job, final = self._future.result()
+            self._future = None
+            if job != self._job:
+                final = None
+        return updates, final
+
+    def close(self):
+        self.stop()
+        self._pool.shutdown(cancel_futures=True)
+
+class _JobStop():
+    """Search.stop_event of a job, set once another job (or none) is current"""
+    def __init__(self, job: int):
+        self.job = job
+
+    def is_set(self) -> bool:
+        return _current.value != self.job
+
+_updates = None
+_current = None
+_search: Search | None = None
+
+def _init_worker(updates, current, book: str | None, tables: str | None):
+    global _updates, _current, _search
+    _updates, _current = updates, current
+    #one search for every job, so the transposition table carries over from move to move
+    _search = Search(chess.Chess(STARTING_FEN, backend="bitboard"))
+    if book:
+        _search.book = chess_book.Book(book)
+    if tables:
+        _search.tablebase = chess_tablebase.Tablebase(tables)
+
+def _analyse(job: int, start_fen: str, moves: list[Move], max_time: float | None, max_depth: int | None) -> tuple[int, SearchResult]:
+    if _current.value != job:
+        return job, SearchResult(None) #replaced before it started
+
+    game = chess.Chess(start_fen, backend="bitboard")
+    for move in moves:
+        game.make_move(move)
+
+    _search.game = game
+    _search.stop_event = _JobStop(job)
+    result = _search.search(max_depth, max_time, on_iteration=lambda result: _updates.put((job, result)))
+    return job, result
@@ -0,0 +1,192 @@
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Literal
+from chess_fen import STARTING_FEN
+from chess_move import Move
+import chess
+import chess_pgn
+import exceptions
+
+#file layout, all little endian:
+#
+#   header   magic, version, game count, offset of the index
+#   games    per game: result, length of the start FEN, plies, the FEN (empty for the standard start),
+#            then one uint16 chess_move per ply
+#   index    one uint64 file offset per game
+#
+#game N is index[N] and ply K of it is a fixed offset from there, nothing before it is read
+
+MAGIC = b"CHSA"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHQQ")
+_GAME = struct.Struct("<BHI")
+
+RESULTS = ("*", "1-0", "0-1", "1/2-1/2")
+
+@dataclass(slots=True)
+class ArchivedGame:
+    index: int
+    start_fen: str
+    result: str
+    moves: array #uint16 chess_move values
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+class ArchiveWriter():
+    """Appends games to a new archive, the index is written on close"""
+    def __init__(self, filename: str):
+        self.file = open(filename, "wb")
+        self.offsets = array("Q")
+        self.file.write(_HEADER.pack(MAGIC, VERSION, 0, 0))
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_moves(self, moves: Iterable[Move], start_fen: str = STARTING_FEN, result: str = "*"):
+        moves = array("H", moves)
+        fen = b"" if start_fen == STARTING_FEN else start_fen.encode("ascii")
+        if sys.byteorder != "little":
+            moves.byteswap()
+
+        self.offsets.append(self.file.tell())
+        self.file.write(_GAME.pack(RESULTS.index(result) if result in RESULTS else 0, len(fen), len(moves)))
+        self.file.write(fen)
+        self.file.write(moves.tobytes())
+
+    def add_game(self, game: chess.Chess):
+        """Stores the moves a game has been played with"""
+        self.add_moves((record.move for record in game.history), game.start_fen, chess_pgn.game_result(game))
+
+    def add_pgn_game(self, pgn_game: chess_pgn.PgnGame):
+        game = chess.Chess(pgn_game.headers.get("FEN", STARTING_FEN), backend="bitboard")
+        moves = array("H")
+        for text in pgn_game.moves:
+            move = chess_pgn.parse_san(game, text)
+            game.make_move(move)
+            moves.append(move)
+        self.add_moves(moves, game.start_fen, pgn_game.result)
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        offsets = array("Q", self.offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        self.file.write(offsets.tobytes())
+
+        self.file.seek(0)
+        self.file.write(_HEADER.pack(MAGIC, VERSION, len(self.offsets), index_offset))
+        self.file.close()
+
+class Archive():
+    """Read only view of an archive, the file is memory mapped and games are decoded on access"""
+    def __init__(self, filename: str):
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, index_offset = _HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise exceptions.InvalidInput(f"{filename} is not a version {VERSION} game archive")
+        self.index = memoryview(self.data)[index_offset:index_offset + 8 * self.count].cast("Q")
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, n: int) -> ArchivedGame:
+        offset = self._game_offset(n)
+        result, fen_length, plies = _GAME.unpack_from(self.data, offset)
+        start = offset + _GAME.size
+        fen = bytes(self.data[start:start + fen_length]).decode("ascii") if fen_length else STARTING_FEN
+
+        moves = array("H")
+        moves.frombytes(self.data[start + fen_length:start + fen_length + 2 * plies])
+        if sys.byteorder != "little":
+            moves.byteswap()
+        return ArchivedGame(n % self.count, fen, RESULTS[result], moves)
+
+    def __iter__(self):
+        for n in range(self.count):
+            yield self[n]
+
+    def plies(self, n: int) -> int:
+        return _GAME.unpack_from(self.data, self._game_offset(n))[2]
+
+    def move(self, n: int, ply: int) -> Move:
+        """ply is 0 based, only the two bytes of that move are read"""
+        offset = self._game_offset(n)
+        _, fen_length, plies = _GAME.unpack_from(self.data, offset)
+        if not 0 <= ply < plies:
+            raise IndexError(f"game {n} has {plies} plies")
+        start = offset + _GAME.size + fen_length + 2 * ply
+        return int.from_bytes(self.data[start:start + 2], "little")
+
+    def replay(self, n: int, plies: int | None = None, backend: Literal["dict", "bitboard"] = "dict") -> chess.Chess:
+        """The game after its first plies moves (all by default), played with Chess.play"""
+        archived = self[n]
+        game = chess.Chess(archived.start_fen, backend)
+        for move in archived.moves[:plies]:
+            game.play(move)
+        return game
+
+    def close(self):
+        if getattr(self, "index", None) is not None:
+            self.index.release()
+            self.index = None # type: ignore
+        self.data.close()
+        self.file.close()
+
+    def _game_offset(self, n: int) -> int:
+        if not -self.count <= n < self.count:
+            raise IndexError(f"archive has {self.count} games")
+        offset = self.index[n]
+        if sys.byteorder != "little":
+            offset = int.from_bytes(offset.to_bytes(8, sys.byteorder), "little")
+        return offset
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary game archives")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="convert a PGN file")
+    build.add_argument("pgn")
+    build.add_argument("archive")
+
+    show = commands.add_parser("show", help="print the position of a game after some plies")
+    show.add_argument("archive")
+    show.add_argument("game", type=int, help="0 based game number")
+    show.add_argument("--ply", type=int, default=None, help="plies to play, the whole game by default")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with ArchiveWriter(args.archive) as writer:
+            for n, pgn_game in enumerate(chess_pgn.read_games(args.pgn)):
+                try:
+                    writer.add_pgn_game(pgn_game)
+                except exceptions.InvalidMove as e:
+                    print(f"game {n + 1} skipped: {e}")
+            print(f"{len(writer.offsets)} games written")
+    else:
+        with Archive(args.archive) as archive:
+            game = archive.replay(args.game, args.ply)
+            game._print_board(game.board)
+            print(game.fen())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+from typing import Iterator
+from utils.Vec2 import Vec2
+
+#square index: a1 = 0, b1 = 1 ... h8 = 63  ->  (y - 1) * 8 + (x - 1)
+#team index: WHITE = 0, BLACK = 1
+#kind index follows KINDS
+
+WHITE, BLACK = 0, 1
+TEAM_INDEX = {"WHITE": WHITE, "BLACK": BLACK}
+TEAM_NAME = ("WHITE", "BLACK")
+
+KINDS = "PNBRQK"
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+KIND_INDEX = {abbreviation: i for i, abbreviation in enumerate(KINDS)}
+
+FULL = (1 << 64) - 1
+
+SQUARES: tuple[Vec2, ...] = tuple(Vec2(i % 8 + 1, i // 8 + 1) for i in range(64))
+
+def square_index(pos: Vec2) -> int:
+    return (pos.y - 1) * 8 + (pos.x - 1)
+
+def iter_bits(bb: int) -> Iterator[int]:
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+#======================TABLES======================
+
+def _step_table(offsets: tuple[tuple[int, int], ...]) -> list[int]:
+    table = []
+    for sq in range(64):
+        x, y = sq % 8, sq // 8
+        bb = 0
+        for dx, dy in offsets:
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                bb |= 1 << ((y + dy) * 8 + x + dx)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _step_table(((-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)))
+KING_ATTACKS = _step_table(((-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)))
+PAWN_ATTACKS = (_step_table(((-1,1),(1,1))), _step_table(((-1,-1),(1,-1)))) #[team][sq]
+
+#positive directions grow the square index (first blocker is the lowest bit), negative ones shrink it
+ORTHOGONAL = ((0,1),(1,0),(0,-1),(-1,0))
+DIAGONAL = ((1,1),(-1,1),(1,-1),(-1,-1))
+
+def _ray_table(dx: int, dy: int) -> list[int]:
+    table = []
+    for sq in range(64):
+        x, y = sq % 8 + dx, sq // 8 + dy
+        bb = 0
+        while 0 <= x < 8 and 0 <= y < 8:
+            bb |= 1 << (y * 8 + x)
+            x, y = x + dx, y + dy
+        table.append(bb)
+    return table
+
+RAYS = {direction: _ray_table(*direction) for direction in ORTHOGONAL + DIAGONAL}
+
+def _is_positive(direction: tuple[int, int]) -> bool:
+    return direction[1] > 0 or (direction[1] == 0 and direction[0] > 0)
+
+def _slider_mask(directions: tuple[tuple[int, int], ...]) -> list[int]:
+    #relevant blockers: the last square of every ray can never block anything
+    masks = []
+    for sq in range(64):
+        bb = 0
+        for direction in directions:
+            ray = RAYS[direction][sq]
+            if ray:
+                edge = ray.bit_length() - 1 if _is_positive(direction) else (ray & -ray).bit_length() - 1
+                bb |= ray & ~(1 << edge)
+        masks.append(bb)
+    return masks
+
+def _between_table() -> list[list[int]]:
+    #squares strictly between two aligned squares, 0 when they don't share a line
+    table = [[0] * 64 for _ in range(64)]
+    for direction in ORTHOGONAL + DIAGONAL:
+        ray_table = RAYS[direction]
+        for sq in range(64):
+            for target in iter_bits(ray_table[sq]):
+                table[sq][target] = ray_table[sq] & ~ray_table[target] & ~(1 << target)
+    return table
+
+BETWEEN = _between_table()
+
+ROOK_MASKS = _slider_mask(ORTHOGONAL)
+BISHOP_MASKS = _slider_mask(DIAGONAL)
+
+def _walk_rays(sq: int, occupied: int, directions: tuple[tuple[int, int], ...]) -> int:
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][sq]
+        blockers = ray & occupied
+        if blockers:
+            if _is_positive(direction):
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= RAYS[direction][first]
+        attacks |= ray
+    return attacks
+
+#attack sets are memoized per square and relevant blockers, filled the first time a blocker set shows up
+_rook_cache: list[dict[int, int]] = [{} for _ in range(64)]
+_bishop_cache: list[dict[int, int]] = [{} for _ in range(64)]
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    key = occupied & ROOK_MASKS[sq]
+    cache = _rook_cache[sq]
+    attacks = cache.get(key)
+    if attacks is None:
+        attacks = cache[key] = _walk_rays(sq, key, ORTHOGONAL)
+    return attacks
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    key = occupied & BISHOP_MASKS[sq]
+    cache = _bishop_cache[sq]
+    attacks = cache.get(key)
+    if attacks is None:
+        attacks = cache[key] = _walk_rays(sq, key, DIAGONAL)
+    return attacks
+
+#======================BOARD======================
+
+class Bitboards():
+    """64-bit bitboards for every (team, kind) plus occupancy masks
+
+    The squares attacked by every piece are kept up to date on each put/remove, only the
+    changed piece and the sliders whose rays reach the changed square are recomputed.
+    """
+    def __init__(self):
+        self.pieces: list[list[int]] = [[0] * 6, [0] * 6] #[team][kind]
+        self.occupied: list[int] = [0, 0] #[team]
+        self.all = 0
+        self.mailbox: list[tuple[int, int] | None] = [None] * 64 #(team, kind) on each square
+
+        self.piece_attacks: list[int] = [0] * 64 #squares attacked by the piece on each square
+        self._attack_maps: list[int | None] = [0, 0] #[team] union of piece_attacks, None until rebuilt
+
+    def put(self, sq: int, team: int, kind: int):
+        if self.mailbox[sq] is not None:
+            self._clear(sq)
+        bit = 1 << sq
+        self.pieces[team][kind] |= bit
+        self.occupied[team] |= bit
+        self.all |= bit
+        self.mailbox[sq] = (team, kind)
+
+        self.piece_attacks[sq] = self._attacks_from(sq, team, kind)
+        self._update_sliders(sq)
+
+    def remove(self, sq: int):
+        if self.mailbox[sq] is None:
+            return
+        self._clear(sq)
+        self._update_sliders(sq)
+
+    def king_square(self, team: int) -> int:
+        return self.pieces[team][KING].bit_length() - 1
+
+    def attack_map(self, team: int) -> int:
+        """every square attacked by team, own pieces included (they are defended)"""
+        attack_map = self._attack_maps[team]
+        if attack_map is None:
+            attack_map = 0
+            piece_attacks = self.piece_attacks
+            occupied = self.occupied[team]
+            while occupied:
+                low = occupied & -occupied
+                attack_map |= piece_attacks[low.bit_length() - 1]
+                occupied ^= low
+            self._attack_maps[team] = attack_map
+        return attack_map
+
+    def _clear(self, sq: int):
+        team, kind = self.mailbox[sq] # type: ignore
+        mask = ~(1 << sq)
+        self.pieces[team][kind] &= mask
+        self.occupied[team] &= mask
+        self.all &= mask
+        self.mailbox[sq] = None
+        self.piece_attacks[sq] = 0
+
+    def _attacks_from(self, sq: int, team: int, kind: int) -> int:
+        if kind == PAWN:
+            return PAWN_ATTACKS[team][sq]
+        if kind == KNIGHT:
+            return KNIGHT_ATTACKS[sq]
+        if kind == KING:
+            return KING_ATTACKS[sq]
+        if kind == ROOK:
+            return rook_attacks(sq, self.all)
+        if kind == BISHOP:
+            return bishop_attacks(sq, self.all)
+        return rook_attacks(sq, self.all) | bishop_attacks(sq, self.all)
+
+    def _update_sliders(self, sq: int):
+        """a slider seeing sq now stops there or runs through it, so its rays change"""
+        white, black = self.pieces
+        rooks = white[ROOK] | white[QUEEN] | black[ROOK] | black[QUEEN]
+        bishops = white[BISHOP] | white[QUEEN] | black[BISHOP] | black[QUEEN]
+        sliders = (rook_attacks(sq, self.all) & rooks) | (bishop_attacks(sq, self.all) & bishops)
+
+        mailbox, piece_attacks = self.mailbox, self.piece_attacks
+        while sliders:
+            low = sliders & -sliders
+            slider = low.bit_length() - 1
+            team, kind = mailbox[slider] # type: ignore
+            piece_attacks[slider] = self._attacks_from(slider, team, kind)
+            sliders ^= low
+        self._attack_maps = [None, None]
+
+    #----------------------------------------------------
+
+    def attackers(self, sq: int, by_team: int, occupied: int, captured: int = 0) -> int:
+        """pieces of by_team attacking sq for the given occupancy, ignoring the pieces on the captured mask"""
+        enemy = self.pieces[by_team]
+        keep = ~captured
+        queens = enemy[QUEEN]
+        return (
+            (KNIGHT_ATTACKS[sq] & enemy[KNIGHT])
+            | (KING_ATTACKS[sq] & enemy[KING])
+            | (PAWN_ATTACKS[by_team ^ 1][sq] & enemy[PAWN])
+            | (rook_attacks(sq, occupied) & (enemy[ROOK] | queens))
+            | (bishop_attacks(sq, occupied) & (enemy[BISHOP] | queens))
+        ) & keep
+
+    def is_attacked(self, sq: int, by_team: int) -> bool:
+        return (self.attack_map(by_team) >> sq) & 1 == 1
+
+    def in_check(self, team: int) -> bool:
+        return self.is_attacked(self.king_square(team), team ^ 1)
+
+    def move_filter(self, team: int) -> tuple[int, int, dict[int, int]]:
+        """(checkers, squares that resolve the check, pin ray of every pinned piece), computed once per position"""
+        king = self.king_square(team)
+        enemy = self.pieces[team ^ 1]
+        checkers = self.attackers(king, team ^ 1, self.all) if self.is_attacked(king, team ^ 1) else 0
+
+        if not checkers:
+            evasions = FULL
+        elif checkers & (checkers - 1):
+            evasions = 0 #double check, only the king can move
+        else:
+            evasions = checkers | BETWEEN[king][checkers.bit_length() - 1]
+
+        pins: dict[int, int] = {}
+        snipers = (
+            (rook_attacks(king, 0) & (enemy[ROOK] | enemy[QUEEN]))
+            | (bishop_attacks(king, 0) & (enemy[BISHOP] | enemy[QUEEN]))
+        )
+        own = self.occupied[team]
+        for sniper in iter_bits(snipers):
+            between = BETWEEN[king][sniper]
+            blockers = between & self.all
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pins[blockers.bit_length() - 1] = between | (1 << sniper)
+
+        return checkers, evasions, pins
+
+    def legal_targets(self, sq: int, move_filter: tuple[int, int, dict[int, int]]) -> int:
+        """legal destinations of the piece on sq, without castling and en passant"""
+        checkers, evasions, pins = move_filter
+        team, kind = self.mailbox[sq] # type: ignore
+
+        if kind == KING:
+            enemy = team ^ 1
+            targets = KING_ATTACKS[sq] & ~self.occupied[team] & ~self.attack_map(enemy)
+
+            #a checking slider also attacks the squares behind the king, the map stops at the king
+            pieces = self.pieces[enemy]
+            occupied = self.all & ~(1 << sq)
+            for checker in iter_bits(checkers & (pieces[ROOK] | pieces[BISHOP] | pieces[QUEEN])):
+                targets &= ~self._xray_attacks(checker, self.mailbox[checker][1], occupied) # type: ignore
+            return targets
+
+        targets = self.piece_targets(sq) & evasions
+        if sq in pins:
+            targets &= pins[sq]
+        return targets
+
+    @staticmethod
+    def _xray_attacks(sq: int, kind: int, occupied: int) -> int:
+        if kind == ROOK:
+            return rook_attacks(sq, occupied)
+        if kind == BISHOP:
+            return bishop_attacks(sq, occupied)
+        return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+    def piece_targets(self, sq: int) -> int:
+        """pseudo-legal destinations of the piece on sq, without castling and en passant"""
+        content = self.mailbox[sq]
+        if content is None:
+            return 0
+        team, kind = content
+        own = self.occupied[team]
+
+        if kind == PAWN:
+            return self._pawn_targets(sq, team)
+        if kind == KNIGHT:
+            return KNIGHT_ATTACKS[sq] & ~own
+        if kind == KING:
+            return KING_ATTACKS[sq] & ~own
+        if kind == ROOK:
+            return rook_attacks(sq, self.all) & ~own
+        if kind == BISHOP:
+            return bishop_attacks(sq, self.all) & ~own
+        return (rook_attacks(sq, self.all) | bishop_attacks(sq, self.all)) & ~own
+
+    def _pawn_targets(self, sq: int, team: int) -> int:
+        empty = ~self.all & FULL
+        if team == WHITE:
+            single = (1 << (sq + 8)) & empty if sq < 56 else 0
+            double = (single << 8) & empty if 8 <= sq < 16 else 0
+        else:
+            single = (1 << (sq - 8)) & empty if sq >= 8 else 0
+            double = (single >> 8) & empty if 48 <= sq < 56 else 0
+        return single | double | (PAWN_ATTACKS[team][sq] & self.occupied[team ^ 1])
+
+    def exposes_king(self, team: int, from_sq: int, to_sq: int, ep_captured: int | None = None) -> bool:
+        """True if moving from_sq to to_sq leaves the king of team attacked, without touching the board"""
+        from_bit, to_bit = 1 << from_sq, 1 << to_sq
+        captured = to_bit
+        occupied = (self.all & ~from_bit) | to_bit
+        if ep_captured is not None:
+            captured |= 1 << ep_captured
+            occupied &= ~(1 << ep_captured)
+
+        king = to_sq if from_bit & self.pieces[team][KING] else self.king_square(team)
+        return self.attackers(king, team ^ 1, occupied, captured) != 0
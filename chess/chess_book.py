@@ -0,0 +1,185 @@
+import argparse
+import mmap
+import random
+import struct
+from collections import defaultdict
+from typing import Iterable
+from chess_fen import STARTING_FEN
+from chess_move import Move, to_uci
+import chess
+import chess_pgn
+import exceptions
+
+#file layout, all little endian:
+#
+#   header   magic, version, entry count
+#   entries  zobrist key, chess_move, weight; sorted by key then weight (highest first)
+#
+#all moves of a position are next to each other, a probe is a binary search for the first of them
+
+MAGIC = b"CHSB"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHQ")
+_ENTRY = struct.Struct("<QHH")
+_KEY = struct.Struct("<Q")
+
+MAX_WEIGHT = 0xFFFF
+#points for the side that played the move
+SCORES = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1), "*": (1, 1)}
+
+class BookWriter():
+    """Counts moves of games, the sorted book is written on close"""
+    def __init__(self, filename: str, max_plies: int = 24):
+        self.filename = filename
+        self.max_plies = max_plies
+        self.weights: dict[int, dict[Move, int]] = defaultdict(lambda: defaultdict(int))
+        self.games = 0
+
+    def __enter__(self) -> "BookWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_moves(self, game: chess.Chess, moves: Iterable[Move], result: str = "*"):
+        """Plays the moves on game, a win counts twice as much as a draw and lost games don't count"""
+        white, black = SCORES.get(result, SCORES["*"])
+        for ply, move in enumerate(moves):
+            if ply >= self.max_plies:
+                break
+            score = white if game.current_team == "WHITE" else black
+            if score:
+                self.weights[game.zobrist_key][move] += score
+            game.make_move(move)
+        self.games += 1
+
+    def add_pgn_game(self, pgn_game: chess_pgn.PgnGame):
+        game = chess.Chess(pgn_game.headers.get("FEN", STARTING_FEN), backend="bitboard")
+        moves = []
+        for text in pgn_game.moves[:self.max_plies]:
+            move = chess_pgn.parse_san(game, text)
+            game.make_move(move)
+            moves.append(move)
+
+        while game.history:
+            game.unmake_move()
+        self.add_moves(game, moves, pgn_game.result)
+
+    def close(self):
+        with open(self.filename, "wb") as file:
+            entries = sum(len(moves) for moves in self.weights.values())
+            file.write(_HEADER.pack(MAGIC, VERSION, entries))
+            for key in sorted(self.weights):
+                moves = self.weights[key]
+                #scale the whole position down so weights keep their proportions
+                scale = max(moves.values()) / MAX_WEIGHT
+                for move, weight in sorted(moves.items(), key=lambda item: -item[1]):
+                    if scale > 1:
+                        weight = max(int(weight / scale), 1)
+                    file.write(_ENTRY.pack(key, move, weight))
+        self.weights.clear()
+
+class Book():
+    """Read only view of an opening book, the file is memory mapped and binary searched on every probe"""
+    def __init__(self, filename: str):
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count = _HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise exceptions.InvalidInput(f"{filename} is not a version {VERSION} opening book")
+
+    def __enter__(self) -> "Book":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, game: chess.Chess) -> bool:
+        return bool(self.moves(game))
+
+    def entries(self, key: int) -> list[tuple[Move, int]]:
+        """(move, weight) stored for a zobrist key, highest weight first"""
+        data = self.data
+        i = self._first(key)
+        entries = []
+        while i < self.count:
+            entry_key, move, weight = _ENTRY.unpack_from(data, _HEADER.size + i * _ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append((move, weight))
+            i += 1
+        return entries
+
+    def moves(self, game: chess.Chess) -> list[tuple[Move, int]]:
+        """Book moves of the position that are legal in it, so a key collision can't play nonsense"""
+        entries = self.entries(game.zobrist_key)
+        if not entries:
+            return entries
+        legal = set(game.get_legal_moves())
+        return [(move, weight) for move, weight in entries if move in legal]
+
+    def choose(self, game: chess.Chess, best: bool = False) -> Move | None:
+        """A random book move picked by weight, or the heaviest one"""
+        moves = self.moves(game)
+        if not moves:
+            return None
+        if best:
+            return moves[0][0]
+        return random.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def _first(self, key: int) -> int:
+        """index of the first entry with a key >= key"""
+        data = self.data
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if _KEY.unpack_from(data, _HEADER.size + middle * _ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+def main():
+    parser = argparse.ArgumentParser(description="Opening books")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="compile a PGN file")
+    build.add_argument("pgn")
+    build.add_argument("book")
+    build.add_argument("--plies", type=int, default=24, help="moves of every game that go into the book")
+
+    show = commands.add_parser("show", help="print the book moves of a position")
+    show.add_argument("book")
+    show.add_argument("fen", nargs="?", default=STARTING_FEN)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with BookWriter(args.book, args.plies) as writer:
+            for n, pgn_game in enumerate(chess_pgn.read_games(args.pgn)):
+                try:
+                    writer.add_pgn_game(pgn_game)
+                except exceptions.InvalidMove as e:
+                    print(f"game {n + 1} skipped: {e}")
+            print(f"{writer.games} games, {len(writer.weights)} positions")
+    else:
+        with Book(args.book) as book:
+            game = chess.Chess(args.fen, backend="bitboard")
+            moves = book.moves(game)
+            total = sum(weight for _, weight in moves)
+            for move, weight in moves:
+                print(f"{chess_pgn.to_san(game, move):8}{to_uci(move):7}{weight:6}  {100 * weight / total:5.1f}%")
+            if not moves:
+                print("not in book")
+
+if __name__ == "__main__":
+    main()
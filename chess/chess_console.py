@@ -1,5 +1,10 @@
 import re
 import chess
+import chess_search
+import chess_book
+import chess_tablebase
+import chess_pgn
+from chess_move import decode
 import exceptions
 from typing import cast, Literal
 from utils.Vec2 import Vec2
@@ -7,9 +12,19 @@ from utils.Vec2 import Vec2
 FILES = "ABCDEFGH"
 POSITION_REGEX = re.compile(r"^[A-H][1-8]$")
 
-FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR"
+FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 
-game = chess.Chess(FEN)
+ENGINE_TEAM = None #"WHITE" or "BLACK" to play against the engine
+ENGINE_TIME = 2.0 #seconds per engine move
+ENGINE_BOOK = None #path of an opening book made with `python chess_book.py build games.pgn book.bin`
+ENGINE_TABLES = None #directory of endgame tables made with `python chess_tablebase.py generate KQvK KRvK KPvK`
+
+game = chess.Chess(FEN, backend="bitboard")
+engine = chess_search.Search(game)
+if ENGINE_BOOK:
+    engine.book = chess_book.Book(ENGINE_BOOK)
+if ENGINE_TABLES:
+    engine.tablebase = chess_tablebase.Tablebase(ENGINE_TABLES)
 
 def decode_position(text: str) -> Vec2 | None:
     text = text.strip().upper()
@@ -84,8 +99,22 @@ def handle_promotion():
         else:
             print("[ERROR] Invalid choice. Please enter Q, R, B, or N.")
 
+def play_engine_move():
+    result = engine.search(max_time=ENGINE_TIME)
+    if result.best_move is None:
+        return
+
+    src, dst, _ = decode(result.best_move)
+    game.play(result.best_move)
+
+    if result.book:
+        print(f"Engine plays {encode_position(src)}{encode_position(dst)}  (book)")
+        return
+    score = f"mate {result.mate_in}" if result.mate_in is not None else f"{result.score / 100:+.2f}"
+    print(f"Engine plays {encode_position(src)}{encode_position(dst)}  ({score}, depth {result.depth}, {result.nodes} nodes, {result.nps} nps)")
+
 def main():
-    while game.status not in (chess.GameStatus.CHECKMATE, chess.GameStatus.STALEMATE):
+    while game.status not in chess.GAME_OVER:
         print_board(game.board)
 
         if game.status == chess.GameStatus.CHECK:
@@ -93,6 +122,11 @@ def main():
 
         print(f"Turn: {game.current_team}")
 
+        if game.current_team == ENGINE_TEAM:
+            play_engine_move()
+            print("-" * 40)
+            continue
+
         src = prompt_position("Select piece: ")
         dst = choose_move(src)
 
@@ -113,8 +147,15 @@ def main():
 
     if game.status == chess.GameStatus.CHECKMATE:
         print("♚ Checkmate!")
+    elif game.status == chess.GameStatus.THREEFOLD_REPETITION:
+        print("½ Draw by threefold repetition!")
+    elif game.status == chess.GameStatus.FIFTY_MOVES:
+        print("½ Draw by the fifty-move rule!")
     else:
         print("½ Stalemate!")
 
+    print()
+    print(chess_pgn.game_to_pgn(game, {"Event": "Console game"}))
+
 if __name__ == "__main__":
     main()
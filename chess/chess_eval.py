@@ -0,0 +1,132 @@
+from chess_pieces import Piece
+
+#material and piece-square tables, scores are centipawns from white's point of view
+#tables are written the way a board is printed: a8 first, h1 last
+
+MAX_PHASE = 24 #phase of the starting material, 0 is a bare king endgame
+PHASE = {"P": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0}
+
+MG_VALUES = {"P": 82, "N": 337, "B": 365, "R": 477, "Q": 1025, "K": 0}
+EG_VALUES = {"P": 94, "N": 281, "B": 297, "R": 512, "Q": 936, "K": 0}
+
+_PAWN_MG = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+)
+#passed or not, a pawn close to promotion is what decides endgames
+_PAWN_EG = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     20,  20,  20,  20,  20,  20,  20,  20,
+     10,  10,  10,  10,  10,  10,  10,  10,
+     10,  10,  10,  10,  10,  10,  10,  10,
+      0,   0,   0,   0,   0,   0,   0,   0,
+)
+_KNIGHT = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+_BISHOP = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+_ROOK = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0,
+)
+_QUEEN = (
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+#behind the pawns while the queens are on, to the centre once they are gone
+_KING_MG = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20,
+)
+_KING_EG = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+)
+
+_TABLES = {
+    "P": (_PAWN_MG, _PAWN_EG),
+    "N": (_KNIGHT, _KNIGHT),
+    "B": (_BISHOP, _BISHOP),
+    "R": (_ROOK, _ROOK),
+    "Q": (_QUEEN, _QUEEN),
+    "K": (_KING_MG, _KING_EG),
+}
+
+def _build(team: str, abbreviation: str) -> list[tuple[int, int, int]]:
+    """(mg, eg, phase) of the piece on every square index, negative for black"""
+    mg_table, eg_table = _TABLES[abbreviation]
+    sign = 1 if team == "WHITE" else -1
+    scores = []
+    for sq in range(64):
+        #square index a1 = 0 is the last row of the tables, black reads them mirrored
+        i = sq ^ 56 if team == "WHITE" else sq
+        scores.append((
+            sign * (MG_VALUES[abbreviation] + mg_table[i]),
+            sign * (EG_VALUES[abbreviation] + eg_table[i]),
+            PHASE[abbreviation],
+        ))
+    return scores
+
+#[team][abbreviation][square index]
+SCORES: dict[str, dict[str, list[tuple[int, int, int]]]] = {
+    team: {abbreviation: _build(team, abbreviation) for abbreviation in _TABLES}
+    for team in ("WHITE", "BLACK")
+}
+_NO_SCORE = [(0, 0, 0)] * 64 #custom pieces aren't valued
+
+def piece_scores(piece: Piece, sq: int) -> tuple[int, int, int]:
+    return SCORES[piece.team].get(piece.abbreviation, _NO_SCORE)[sq]
+
+def tapered(mg: int, eg: int, phase: int) -> int:
+    """blends the middlegame and endgame scores by how much material is left"""
+    phase = min(phase, MAX_PHASE)
+    return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
@@ -0,0 +1,181 @@
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import IO, Iterator, Literal
+from chess_pieces import Piece, SQUARES
+from chess_move import FILES, square_name
+from utils.Vec2 import Vec2
+import exceptions
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+#same bits as chess.CASTLING
+CASTLING_CHARS = (("K", 1), ("Q", 2), ("k", 4), ("q", 8))
+CASTLING_BITS = dict(CASTLING_CHARS)
+
+@dataclass(slots=True)
+class Fen:
+    """A parsed FEN record, fields that were left out keep their defaults"""
+    board: dict[Vec2, Piece]
+    team: Literal["WHITE", "BLACK"] = "WHITE"
+    castling_rights: int | None = None #None when only the placement was given
+    en_passant: Vec2 | None = None #square the pawn skipped
+    halfmove_clock: int = 0
+    fullmove_number: int = 1
+    operations: dict[str, str] = field(default_factory=dict) #EPD opcodes, e.g. {"bm": "Nf3", "id": "WAC.001"}
+
+#======================PARSING======================
+
+def parse_fen(fen: str) -> Fen:
+    """Accepts full six field FEN as well as the placement alone or with only some of the fields"""
+    fields = fen.split()
+    if not 1 <= len(fields) <= 6:
+        raise exceptions.InvalidBoard("Invalid FEN")
+
+    state = Fen(parse_placement(fields[0]))
+    if len(fields) > 1:
+        state.team = _parse_team(fields[1])
+    if len(fields) > 2:
+        state.castling_rights = _parse_castling(fields[2])
+    if len(fields) > 3:
+        state.en_passant = _parse_square(fields[3])
+    if len(fields) > 4:
+        state.halfmove_clock = _parse_counter(fields[4])
+    if len(fields) > 5:
+        state.fullmove_number = _parse_counter(fields[5])
+    return state
+
+def parse_placement(placement: str) -> dict[Vec2, Piece]:
+    rows = placement.split("/")
+    if len(rows) != 8:
+        raise exceptions.InvalidBoard("Invalid FEN")
+
+    board: dict[Vec2, Piece] = {}
+    for y_index, row in enumerate(rows):
+        board.update(_parse_rank(row, 8 - y_index))
+    return board
+
+#ranks like "8" or "pppppppp" repeat across almost every position of a file, so each is parsed once
+@lru_cache(maxsize=1 << 14)
+def _parse_rank(row: str, y: int) -> tuple[tuple[Vec2, Piece], ...]:
+    squares = []
+    x = 1
+    for char in row:
+        if char.isdigit():
+            x += int(char)
+            continue
+
+        piece = Piece.create_piece(char, "WHITE" if char.isupper() else "BLACK")
+        if piece is None:
+            raise exceptions.InvalidBoard(f"Invalid FEN piece {char!r}")
+        if x > 8:
+            raise exceptions.InvalidBoard(f"Invalid FEN rank {row!r}")
+        squares.append((SQUARES[(x, y)], piece))
+        x += 1
+
+    if x != 9:
+        raise exceptions.InvalidBoard(f"Invalid FEN rank {row!r}")
+    return tuple(squares)
+
+def _parse_team(text: str) -> Literal["WHITE", "BLACK"]:
+    if text not in ("w", "b"):
+        raise exceptions.InvalidBoard(f"Invalid FEN side to move {text!r}")
+    return "WHITE" if text == "w" else "BLACK"
+
+def _parse_castling(text: str) -> int:
+    if text == "-":
+        return 0
+    rights = 0
+    for char in text:
+        bit = CASTLING_BITS.get(char)
+        if bit is None:
+            raise exceptions.InvalidBoard(f"Invalid FEN castling rights {text!r}")
+        rights |= bit
+    return rights
+
+def _parse_square(text: str) -> Vec2 | None:
+    if text == "-":
+        return None
+    if len(text) != 2 or text[0] not in FILES or text[1] not in "36":
+        raise exceptions.InvalidBoard(f"Invalid FEN en passant square {text!r}")
+    return Vec2(FILES.index(text[0]) + 1, int(text[1]))
+
+def _parse_counter(text: str) -> int:
+    if not text.isdigit():
+        raise exceptions.InvalidBoard(f"Invalid FEN move counter {text!r}")
+    return int(text)
+
+#======================FORMATTING======================
+
+def format_fen(board: dict[Vec2, Piece], team: Literal["WHITE", "BLACK"], castling_rights: int,
+               en_passant: Vec2 | None, halfmove_clock: int, fullmove_number: int) -> str:
+    castling = "".join(char for char, bit in CASTLING_CHARS if castling_rights & bit) or "-"
+    ep = square_name(en_passant) if en_passant else "-"
+    return f"{format_placement(board)} {'w' if team == 'WHITE' else 'b'} {castling} {ep} {halfmove_clock} {fullmove_number}"
+
+def format_placement(board: dict[Vec2, Piece]) -> str:
+    rows = []
+    for y in range(8, 0, -1):
+        row, empty = "", 0
+        for x in range(1, 9):
+            piece = board.get(SQUARES[(x, y)])
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            row += piece.abbreviation if piece.team == "WHITE" else piece.abbreviation.lower()
+        rows.append(row + str(empty) if empty else row)
+    return "/".join(rows)
+
+#======================FILES======================
+
+def read_positions(source: str | IO[str]) -> Iterator[Fen]:
+    """Streams the positions of a FEN or EPD file (a path or an open file) one line at a time
+
+    Blank lines and lines starting with # are skipped. EPD lines have four fields followed by
+    operations, the hmvc and fmvn operations fill in the move counters.
+    """
+    if isinstance(source, str):
+        with open(source, encoding="utf-8") as file:
+            yield from read_positions(file)
+        return
+
+    for line_number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield parse_epd(line)
+        except exceptions.InvalidBoard as e:
+            raise exceptions.InvalidBoard(f"line {line_number}: {e}") from None
+
+def parse_epd(line: str) -> Fen:
+    """One FEN or EPD line"""
+    fields = line.split(maxsplit=4)
+    if len(fields) < 4:
+        return parse_fen(line)
+
+    rest = fields[4] if len(fields) > 4 else ""
+    counters = rest.split(maxsplit=2)
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():
+        #plain six field FEN, anything after the counters is read as operations
+        state = parse_fen(" ".join(fields[:4] + counters[:2]))
+        rest = counters[2] if len(counters) > 2 else ""
+    else:
+        state = parse_fen(" ".join(fields[:4]))
+
+    state.operations = _parse_operations(rest)
+    if state.operations.get("hmvc", "").isdigit():
+        state.halfmove_clock = int(state.operations["hmvc"])
+    if state.operations.get("fmvn", "").isdigit():
+        state.fullmove_number = int(state.operations["fmvn"])
+    return state
+
+def _parse_operations(text: str) -> dict[str, str]:
+    operations = {}
+    for operation in text.split(";"):
+        opcode, _, operand = operation.strip().partition(" ")
+        if opcode:
+            operations[opcode] = operand.strip().strip('"')
+    return operations
@@ -0,0 +1,91 @@
+from array import array
+from typing import Iterable, Literal
+from utils.Vec2 import Vec2
+from chess_bitboard import SQUARES
+
+#a move is a 16 bit int:  flags << 12 | to square << 6 | from square
+#squares are bitboard indexes (a1 = 0, h8 = 63), flags follow the usual from-to-flags layout:
+#
+#   0  quiet             4  capture
+#   1  double pawn push  5  en passant capture
+#   2  king side castle  8-11  promotion to N, B, R, Q
+#   3  queen side castle 12-15 promotion with capture
+
+Move = int
+
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8
+
+PROMOTION_PIECES: tuple[Literal["N", "B", "R", "Q"], ...] = ("N", "B", "R", "Q")
+PROMOTION_FLAGS = {piece: PROMOTION | i for i, piece in enumerate(PROMOTION_PIECES)}
+
+NULL_MOVE = 0 #a1a1, never a legal move
+
+FILES = "abcdefgh"
+
+def encode(from_sq: int, to_sq: int, flags: int = QUIET) -> Move:
+    return flags << 12 | to_sq << 6 | from_sq
+
+def move_from(move: Move) -> int:
+    return move & 0x3F
+
+def move_to(move: Move) -> int:
+    return move >> 6 & 0x3F
+
+def move_flags(move: Move) -> int:
+    return move >> 12
+
+def is_capture(move: Move) -> bool:
+    return bool(move & CAPTURE << 12)
+
+def is_promotion(move: Move) -> bool:
+    return bool(move & PROMOTION << 12)
+
+def is_castle(move: Move) -> bool:
+    return move >> 12 in (KING_CASTLE, QUEEN_CASTLE)
+
+def is_en_passant(move: Move) -> bool:
+    return move >> 12 == EN_PASSANT
+
+def promotion_piece(move: Move) -> Literal["N", "B", "R", "Q"] | None:
+    """piece the pawn turns into, None if the move isn't a promotion"""
+    if not move & PROMOTION << 12:
+        return None
+    return PROMOTION_PIECES[move >> 12 & 3]
+
+def decode(move: Move) -> tuple[Vec2, Vec2, Literal["N", "B", "R", "Q"] | None]:
+    """(pos_1, pos_2, promotion) in board coordinates, what Chess.move and promote take"""
+    return SQUARES[move & 0x3F], SQUARES[move >> 6 & 0x3F], promotion_piece(move)
+
+def move_list(moves: Iterable[Move] = ()) -> array:
+    """two bytes per move instead of a python object"""
+    return array("H", moves)
+
+#======================TEXT======================
+
+def square_name(pos: Vec2) -> str:
+    return f"{FILES[pos.x - 1]}{pos.y}"
+
+def to_uci(move: Move) -> str:
+    """long algebraic notation, e.g. e2e4 or e7e8q"""
+    pos_1, pos_2, promotion = decode(move)
+    name = square_name(pos_1) + square_name(pos_2)
+    return name + promotion.lower() if promotion else name
+
+def from_uci(text: str, legal_moves: Iterable[Move]) -> Move | None:
+    """the legal move written as text, the flags depend on the position so it is looked up"""
+    text = text.strip().lower()
+    for move in legal_moves:
+        if to_uci(move) == text:
+            return move
+    return None
+
+def parse_square(text: str) -> Vec2 | None:
+    if len(text) != 2 or text[0] not in FILES or text[1] not in "12345678":
+        return None
+    return SQUARES[(int(text[1]) - 1) * 8 + FILES.index(text[0])]
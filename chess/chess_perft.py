@@ -0,0 +1,75 @@
+import argparse
+import json
+import sys
+import time
+from typing import Literal
+import chess
+from chess_move import to_uci
+
+#name: (fen, leaf nodes for depth 1, 2, 3...)
+POSITIONS: dict[str, tuple[str, list[int]]] = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", [20, 400, 8902, 197281, 4865609]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890, 3894594]),
+}
+
+def run(name: str, depth: int, backend: Literal["dict", "bitboard"], divide: bool) -> dict:
+    fen, expected = POSITIONS[name]
+    game = chess.Chess(fen, backend=backend)
+
+    start = time.perf_counter()
+    if divide:
+        split = {to_uci(move): nodes for move, nodes in game.divide(depth).items()}
+        nodes = sum(split.values())
+    else:
+        split = None
+        nodes = game.perft(depth)
+    seconds = time.perf_counter() - start
+
+    result = {
+        "position": name,
+        "fen": fen,
+        "backend": backend,
+        "depth": depth,
+        "nodes": nodes,
+        "expected": expected[depth - 1] if depth <= len(expected) else None,
+        "seconds": round(seconds, 4),
+        "nps": round(nodes / seconds) if seconds > 0 else None,
+    }
+    result["ok"] = result["expected"] is None or nodes == result["expected"]
+    if split is not None:
+        result["divide"] = split
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft node counts and speed of the chess move generator")
+    parser.add_argument("-p", "--position", choices=sorted(POSITIONS), action="append", help="position to run, repeatable (default: all)")
+    parser.add_argument("-d", "--depth", type=int, default=3)
+    parser.add_argument("-b", "--backend", choices=("dict", "bitboard"), default="bitboard")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--json", metavar="FILE", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.position or POSITIONS:
+        result = run(name, args.depth, args.backend, args.divide)
+        results.append(result)
+
+        for move, nodes in result.get("divide", {}).items():
+            print(f"  {move}: {nodes}")
+
+        status = "OK" if result["ok"] else f"FAIL (expected {result['expected']})"
+        print(f"{name:<10} depth {args.depth}  {result['nodes']:>10} nodes  {result['seconds']:>8.3f}s  {result['nps'] or 0:>9} nps  {status}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, file, indent=2)
+
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import argparse
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from typing import IO, Iterable, Iterator, Literal
+from chess_fen import STARTING_FEN
+from chess_move import Move, FILES, decode, move_from, move_to, promotion_piece, is_capture, square_name, KING_CASTLE, QUEEN_CASTLE
+from chess_bitboard import SQUARES
+import chess
+import exceptions
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+#the seven tag roster, written first and in this order
+ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+
+_TAG = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]$')
+#comments, variations, NAGs, move numbers, results and everything else as a move
+_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|[()]|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s{}();$]+')
+_SAN = re.compile(r"^([NBRQKM])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+@dataclass
+class PgnGame:
+    """Tags and SAN moves of one game, the moves are only checked when the game is played"""
+    headers: dict[str, str] = field(default_factory=dict)
+    moves: list[str] = field(default_factory=list)
+    result: str = "*"
+
+    def play(self, backend: Literal["dict", "bitboard"] = "dict") -> chess.Chess:
+        """Replays the moves with Chess.move/promote, InvalidMove tells which one failed"""
+        game = chess.Chess(self.headers.get("FEN", STARTING_FEN), backend)
+        for ply, text in enumerate(self.moves):
+            try:
+                play_san(game, text)
+            except (exceptions.InvalidMove, exceptions.GameEnded) as e:
+                raise exceptions.InvalidMove(f"ply {ply + 1} ({text}): {e}") from None
+        return game
+
+@dataclass
+class ReplayResult:
+    index: int #position of the game in the source
+    headers: dict[str, str]
+    plies: int #moves played before the end or the first error
+    fen: str
+    status: str #GameStatus name of the final position
+    error: str | None = None
+
+#======================SAN======================
+
+def to_san(game: chess.Chess, move: Move) -> str:
+    """SAN of a legal move of the current position, check and mate marks included"""
+    pos_1, pos_2, promotion = decode(move)
+    piece = game.board[pos_1]
+    flags = move >> 12
+
+    if flags == KING_CASTLE:
+        san = "O-O"
+    elif flags == QUEEN_CASTLE:
+        san = "O-O-O"
+    elif piece.abbreviation == "P":
+        san = f"{FILES[pos_1.x - 1]}x" if is_capture(move) else ""
+        san += square_name(pos_2) + (f"={promotion}" if promotion else "")
+    else:
+        san = piece.abbreviation + _disambiguation(game, move) + ("x" if is_capture(move) else "") + square_name(pos_2)
+
+    game.make_move(move)
+    if game.is_in_check():
+        san += "+" if game.get_legal_moves() else "#"
+    game.unmake_move()
+    return san
+
+def parse_san(game: chess.Chess, text: str) -> Move:
+    """The legal move of the current position written as text"""
+    san = text.rstrip("+#!?")
+    moves = game.get_legal_moves()
+
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        flag = KING_CASTLE if len(san) == 3 else QUEEN_CASTLE
+        for move in moves:
+            if move >> 12 == flag:
+                return move
+        raise exceptions.InvalidMove(f"Illegal move {text}")
+
+    match = _SAN.match(san)
+    if not match:
+        raise exceptions.InvalidMove(f"Invalid SAN {text}")
+    kind, from_file, from_rank, _, target, promotion = match.groups()
+    kind = kind or "P"
+    to_sq = (int(target[1]) - 1) * 8 + FILES.index(target[0])
+
+    candidates = []
+    for move in moves:
+        if move_to(move) != to_sq or promotion_piece(move) != promotion:
+            continue
+        pos = SQUARES[move_from(move)]
+        if game.board[pos].abbreviation != kind:
+            continue
+        if from_file and pos.x != FILES.index(from_file) + 1:
+            continue
+        if from_rank and pos.y != int(from_rank):
+            continue
+        candidates.append(move)
+
+    if len(candidates) != 1:
+        raise exceptions.InvalidMove(f"{'Ambiguous' if candidates else 'Illegal'} move {text}")
+    return candidates[0]
+
+def play_san(game: chess.Chess, text: str):
+    """Plays a SAN move through Chess.play, promotion included"""
+    game.play(parse_san(game, text))
+
+def _disambiguation(game: chess.Chess, move: Move) -> str:
+    pos_1 = SQUARES[move_from(move)]
+    kind = game.board[pos_1].abbreviation
+    others = [
+        SQUARES[move_from(other)] for other in game.get_legal_moves()
+        if move_to(other) == move_to(move) and move_from(other) != move_from(move)
+        and game.board[SQUARES[move_from(other)]].abbreviation == kind
+    ]
+    if not others:
+        return ""
+    if all(pos.x != pos_1.x for pos in others):
+        return FILES[pos_1.x - 1]
+    if all(pos.y != pos_1.y for pos in others):
+        return str(pos_1.y)
+    return square_name(pos_1)
+
+#======================READING======================
+
+def read_games(source: str | IO[str]) -> Iterator[PgnGame]:
+    """Streams the games of a PGN file (a path or an open file), one game in memory at a time"""
+    if isinstance(source, str):
+        with open(source, encoding="utf-8", errors="replace") as file:
+            yield from read_games(file)
+        return
+
+    headers: dict[str, str] = {}
+    movetext: list[str] = []
+    for line in source:
+        line = line.strip()
+        if line.startswith("%"):
+            continue
+
+        tag = _TAG.match(line) if line.startswith("[") else None
+        if tag:
+            if movetext:
+                yield _parse_game(headers, movetext)
+                headers, movetext = {}, []
+            headers[tag.group(1)] = tag.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        elif line:
+            movetext.append(line)
+
+    if headers or movetext:
+        yield _parse_game(headers, movetext)
+
+def _parse_game(headers: dict[str, str], movetext: list[str]) -> PgnGame:
+    game = PgnGame(headers, result=headers.get("Result", "*"))
+    variation = 0
+    for token in _TOKEN.findall("\n".join(movetext)):
+        if token == "(":
+            variation += 1
+        elif token == ")":
+            variation = max(variation - 1, 0)
+        elif variation or token[0] in "{;$" or token[0].isdigit() and token.rstrip(".").isdigit():
+            continue
+        elif token in RESULTS:
+            game.result = token
+        else:
+            game.moves.append(token)
+    return game
+
+#======================WRITING======================
+
+def game_to_pgn(game: chess.Chess, headers: dict[str, str] | None = None) -> str:
+    """PGN of a game played through Chess.move/promote, e.g. in the console or Tk frontend"""
+    replay = chess.Chess(game.start_fen)
+    sans = []
+    for record in game.history:
+        sans.append(to_san(replay, record.move))
+        replay.make_move(record.move)
+
+    tags = {"Event": "?", "Site": "?", "Date": date.today().strftime("%Y.%m.%d"), "Round": "?", "White": "?", "Black": "?"}
+    tags.update(headers or {})
+    tags["Result"] = game_result(game)
+    if game.start_fen != STARTING_FEN:
+        tags["SetUp"], tags["FEN"] = "1", game.start_fen
+
+    return format_pgn(tags, sans, tags["Result"], *_move_numbering(game.start_fen))
+
+def game_result(game: chess.Chess) -> str:
+    if game.status == chess.GameStatus.CHECKMATE:
+        return "0-1" if game.current_team == "WHITE" else "1-0"
+    if game.status in chess.GAME_OVER:
+        return "1/2-1/2"
+    return "*"
+
+def format_pgn(headers: dict[str, str], sans: Iterable[str], result: str = "*", fullmove_number: int = 1, first_ply: int = 0) -> str:
+    """first_ply is 1 when black moves first"""
+    lines = []
+    for name in ROSTER + tuple(name for name in headers if name not in ROSTER):
+        value = headers.get(name, result if name == "Result" else "?")
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'[{name} "{escaped}"]')
+    lines.append("")
+
+    tokens = []
+    for ply, san in enumerate(sans, first_ply):
+        number = fullmove_number + ply // 2
+        if ply % 2 == 0:
+            tokens.append(f"{number}.")
+        elif ply == first_ply:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+    tokens.append(result)
+
+    #wrapped at 80 columns like most exporters
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def write_games(games: Iterable[PgnGame], target: str | IO[str]):
+    """Writes PgnGames back out, one blank line between games"""
+    if isinstance(target, str):
+        with open(target, "w", encoding="utf-8") as file:
+            write_games(games, file)
+        return
+
+    for game in games:
+        numbering = _move_numbering(game.headers.get("FEN", STARTING_FEN))
+        target.write(format_pgn(game.headers, game.moves, game.result, *numbering) + "\n")
+
+def _move_numbering(fen: str) -> tuple[int, int]:
+    """(fullmove number, first ply) of a FEN, the first ply is 1 when black is to move"""
+    fields = fen.split()
+    fullmove = int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+    return fullmove, 1 if len(fields) > 1 and fields[1] == "b" else 0
+
+#======================BATCH REPLAY======================
+
+def replay_games(games: Iterable[PgnGame], processes: int | None = None, batch_size: int = 64,
+                 backend: Literal["dict", "bitboard"] = "bitboard") -> Iterator[ReplayResult]:
+    """Replays every game on a process pool and yields the results in source order
+
+    Games are sent in batches and only a few batches are in flight at once, so the source is
+    read as fast as the workers go and never loaded whole.
+    """
+    processes = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(processes) as executor:
+        in_flight: deque[Future] = deque()
+        limit = 2 * processes
+
+        batch: list[tuple[int, PgnGame]] = []
+        for index, game in enumerate(games):
+            batch.append((index, game))
+            if len(batch) == batch_size:
+                in_flight.append(executor.submit(_replay_batch, batch, backend))
+                batch = []
+                while len(in_flight) >= limit:
+                    yield from in_flight.popleft().result()
+        if batch:
+            in_flight.append(executor.submit(_replay_batch, batch, backend))
+
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+def replay_game(index: int, pgn_game: PgnGame, backend: Literal["dict", "bitboard"] = "bitboard") -> ReplayResult:
+    """Replays one game move by move and reports where it stopped"""
+    try:
+        game = chess.Chess(pgn_game.headers.get("FEN", STARTING_FEN), backend)
+    except exceptions.InvalidBoard as e:
+        return ReplayResult(index, pgn_game.headers, 0, "", "", f"FEN: {e}")
+
+    error = None
+    for text in pgn_game.moves:
+        try:
+            play_san(game, text)
+        except (exceptions.InvalidMove, exceptions.GameEnded) as e:
+            error = f"ply {len(game.history) + 1} ({text}): {e}"
+            break
+    return ReplayResult(index, pgn_game.headers, len(game.history), game.fen(), game.status.name, error)
+
+def _replay_batch(batch: list[tuple[int, PgnGame]], backend: Literal["dict", "bitboard"]) -> list[ReplayResult]:
+    return [replay_game(index, game, backend) for index, game in batch]
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays every game of a PGN file and reports the ones that don't play out")
+    parser.add_argument("pgn", help="PGN file")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="worker processes (default: one per cpu)")
+    parser.add_argument("--batch", type=int, default=64, help="games per task sent to a worker")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games = errors = 0
+    for result in replay_games(read_games(args.pgn), args.processes, args.batch):
+        games += 1
+        if result.error is not None:
+            errors += 1
+            print(f"game {result.index + 1} ({result.headers.get('White', '?')} - {result.headers.get('Black', '?')}): {result.error}")
+
+    seconds = time.perf_counter() - start
+    print(f"{games} games, {errors} with errors, {seconds:.1f}s ({games / seconds if seconds else 0:.0f} games/s)")
+
+if __name__ == "__main__":
+    main()
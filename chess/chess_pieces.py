@@ -12,10 +12,61 @@ PIECES_MAP = {
     "M": {"NAME": "TEST", "WHITE": "m", "BLACK": "M"},
 }
 
+ORTHOGONAL = ((-1,0),(0,-1),(0,1),(1,0))
+DIAGONAL = ((-1,-1),(-1,1),(1,-1),(1,1))
+KNIGHT_OFFSETS = ((-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1))
+
+#======================SQUARE TABLES======================
+#built once at import, every square is the same Vec2 instance in all tables
+
+SQUARES: dict[tuple[int, int], Vec2] = {(x, y): Vec2(x, y) for y in range(1, 9) for x in range(1, 9)}
+
+def _targets(offsets: tuple[tuple[int, int], ...]) -> dict[Vec2, tuple[Vec2, ...]]:
+    return {
+        pos: tuple(SQUARES[(x + dx, y + dy)] for dx, dy in offsets if (x + dx, y + dy) in SQUARES)
+        for (x, y), pos in SQUARES.items()
+    }
+
+def _ray(x: int, y: int, dx: int, dy: int) -> tuple[Vec2, ...]:
+    squares = []
+    x, y = x + dx, y + dy
+    while (x, y) in SQUARES:
+        squares.append(SQUARES[(x, y)])
+        x, y = x + dx, y + dy
+    return tuple(squares)
+
+def _pawn_pushes(direction: int, start_rank: int) -> dict[Vec2, tuple[Vec2, ...]]:
+    pushes = {}
+    for (x, y), pos in SQUARES.items():
+        steps = 2 if y == start_rank else 1
+        pushes[pos] = tuple(SQUARES[(x, y + direction * i)] for i in range(1, steps + 1) if (x, y + direction * i) in SQUARES)
+    return pushes
+
+KNIGHT_TARGETS = _targets(KNIGHT_OFFSETS)
+KING_TARGETS = _targets(ORTHOGONAL + DIAGONAL)
+#squares in walking order from pos towards the edge: RAYS[pos][direction]
+RAYS: dict[Vec2, dict[tuple[int, int], tuple[Vec2, ...]]] = {
+    pos: {direction: _ray(x, y, *direction) for direction in ORTHOGONAL + DIAGONAL}
+    for (x, y), pos in SQUARES.items()
+}
+PAWN_PUSHES = {"WHITE": _pawn_pushes(1, 2), "BLACK": _pawn_pushes(-1, 7)}
+PAWN_CAPTURES = {"WHITE": _targets(((-1,1),(1,1))), "BLACK": _targets(((-1,-1),(1,-1)))}
+
 class Piece(ABC):
+    """Pieces hold no game state, create_piece hands out one shared instance per type and team"""
     Pieces: dict[str, Type["Piece"]] = {}
+    _instances: dict[tuple[str, str], "Piece"] = {}
+    __slots__ = ("team",)
+
     def __init__(self, team: Literal["WHITE", "BLACK"]):
-        self.team: Literal["WHITE", "BLACK"] = team
+        object.__setattr__(self, "team", team)
+
+    #one write would change the piece on every board that shares it
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"{self!r} is shared between games and can't be changed")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{self!r} is shared between games and can't be changed")
 
     def __init_subclass__(cls, *, abbreviation: str, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -29,15 +80,30 @@ class Piece(ABC):
     def __repr__(self) -> str:
         return f"{self.team} {self.__class__.__name__}"
 
+    #shared instances are never copied, a copied board keeps pointing at them
+    def __copy__(self) -> "Piece":
+        return self
+
+    def __deepcopy__(self, memo: dict) -> "Piece":
+        return self
+
+    #unpickled pieces are the shared instances of that process too
+    def __reduce__(self):
+        return Piece.create_piece, (self.abbreviation, self.team)
+
     @abstractmethod
     def get_moves(self, pos: Vec2, board: dict[Vec2, "Piece"]) -> list[Vec2]: ...
 
     @staticmethod
     def create_piece(abbreviation: str, team: Literal["WHITE", "BLACK"]) -> "Piece | None":
-        cls = Piece.Pieces.get(abbreviation.upper())
-        if cls is None:
-            return None
-        return cls(team)
+        abbreviation = abbreviation.upper()
+        piece = Piece._instances.get((abbreviation, team))
+        if piece is None:
+            cls = Piece.Pieces.get(abbreviation)
+            if cls is None:
+                return None
+            piece = Piece._instances[(abbreviation, team)] = cls(team)
+        return piece
     
     @staticmethod
     def in_board(pos: Vec2) -> bool:
@@ -45,18 +111,12 @@ class Piece(ABC):
     
     def orthogonal_diagonal(self, pos: Vec2, board: dict[Vec2, "Piece"], mode: tuple[bool, bool], reach: int) -> list[Vec2]:
         moves: list[Vec2] = []
-        ortogonal = ((-1,0),(0,-1),(0,1),(1,0))
-        diagonal = ((-1,-1),(-1,1),(1,-1),(1,1))
-
-        directions = ((ortogonal if mode[0] else ()) + (diagonal if mode[1] else ()))
-
-        for x, y in directions:
-            for i in range(1, reach + 1):
-                dest = Vec2(pos.x + x*i, pos.y + y*i)
-
-                if not self.in_board(dest):
-                    break
+        directions = ((ORTHOGONAL if mode[0] else ()) + (DIAGONAL if mode[1] else ()))
+        rays = RAYS[pos]
 
+        for direction in directions:
+            ray = rays[direction]
+            for dest in (ray if reach >= len(ray) else ray[:reach]):
                 if dest in board:
                     if board[dest].team != self.team:
                         moves.append(dest)
@@ -78,49 +138,23 @@ class Pawn(Piece, abbreviation="P"):
     def get_moves(self, pos: Vec2, board: dict[Vec2, Piece]) -> list[Vec2]:
         moves: list[Vec2] = []
 
-        direction = 1 if self.team == "WHITE" else -1
-        
-        front = pos.y + direction
-        if not self.in_board(Vec2(pos.x, front)):
-            return []
-        
-        if Vec2(pos.x, front) not in board:
-            moves.append(Vec2(pos.x, front))
-
-            start_rank = 2 if self.team == "WHITE" else 7
-            double_front = pos.y + 2 * direction
-            if pos.y == start_rank:
-                if Vec2(pos.x, double_front) not in board:
-                    moves.append(Vec2(pos.x, double_front))
-
-        for i in (-1,1):
-            diag = pos.x + i
-            target = Vec2(diag, front)
+        for dest in PAWN_PUSHES[self.team][pos]:
+            if dest in board:
+                break
+            moves.append(dest)
+
+        for target in PAWN_CAPTURES[self.team][pos]:
             if target in board and board[target].team != self.team:
-                    moves.append(Vec2(diag,front))
+                moves.append(target)
 
-        filtered = [m for m in moves if self.in_board(m)]
-        return filtered
+        return moves
     
 class Knight(Piece, abbreviation="N"):
     def __init__(self, team: Literal["WHITE", "BLACK"]):
         super().__init__(team=team)
 
     def get_moves(self, pos: Vec2, board: dict[Vec2, Piece]) -> list[Vec2]:
-        moves: list[Vec2] = []
-
-        possible_moves = ((-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1))
-
-        for x,y in possible_moves:
-            dest = Vec2(pos.x+x, pos.y+y)
-            if not self.in_board(dest):
-                continue
-            if dest in board and board[dest].team == self.team:
-                continue
-            moves.append(dest)
-
-        filtered = [mv for mv in moves if self.in_board(mv)]
-        return filtered
+        return [dest for dest in KNIGHT_TARGETS[pos] if dest not in board or board[dest].team != self.team]
     
 class Bishop(Piece, abbreviation="B"):
     def __init__(self, team: Literal["WHITE", "BLACK"]):
@@ -133,7 +167,6 @@ class Bishop(Piece, abbreviation="B"):
 class Rook(Piece, abbreviation="R"):
     def __init__(self, team: Literal["WHITE", "BLACK"]):
         super().__init__(team=team)
-        self.moved = False
 
     def get_moves(self, pos: Vec2, board: dict[Vec2, Piece]) -> list[Vec2]:
         moves: list[Vec2] = self.orthogonal_diagonal(pos, board, (True, False), 8)
@@ -150,16 +183,12 @@ class Queen(Piece, abbreviation="Q"):
 class King(Piece, abbreviation="K"):
     def __init__(self, team: Literal["WHITE", "BLACK"]):
         super().__init__(team=team)
-        self.moved = False
  
     def get_moves(self, pos: Vec2, board: dict[Vec2, Piece]) -> list[Vec2]:
-        moves: list[Vec2] = self.orthogonal_diagonal(pos, board, (True, True), 1)
-        return moves
+        return [dest for dest in KING_TARGETS[pos] if dest not in board or board[dest].team != self.team]
     
-    def castle(self, board: dict[Vec2, Piece]) -> list[Vec2]:
-        if self.moved:
-            return []
-
+    def castle(self, board: dict[Vec2, Piece], rook_squares: list[Vec2]) -> list[Vec2]:
+        """castling destinations towards the rooks that still have the right, the position keeps the rights"""
         moves: list[Vec2] = []
         rank = 1 if self.team == "WHITE" else 8
 
@@ -170,13 +199,11 @@ class King(Piece, abbreviation="K"):
         ]
 
         for rook_pos, between, king_dest in castles:
-            if rook_pos not in board:
+            if rook_pos not in rook_squares or rook_pos not in board:
                 continue
 
             rook = board[rook_pos]
-            if not isinstance(rook, Rook):
-                continue
-            if rook.team != self.team or rook.moved:
+            if not isinstance(rook, Rook) or rook.team != self.team:
                 continue
             if any(square in board for square in between):
                 continue
@@ -185,6 +212,8 @@ class King(Piece, abbreviation="K"):
 
         return moves
     
+STANDARD_PIECES = (Pawn, Knight, Bishop, Rook, Queen, King)
+
 class yourmom(Piece, abbreviation="M"):
     def __init__(self, team: Literal["WHITE", "BLACK"]):
         super().__init__(team=team)
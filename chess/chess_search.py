@@ -0,0 +1,396 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+from chess_move import Move, is_capture, promotion_piece
+from chess_transposition import TranspositionTable, SharedTranspositionTable, EXACT, LOWER, UPPER
+from chess_bitboard import SQUARES
+import chess
+import exceptions
+
+INFINITY = 1_000_000
+MATE = 100_000
+MATE_BOUND = MATE - 1000 #scores above this are mates
+MAX_PLY = 128
+
+PIECE_VALUES = {"P": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+CHECK_EVERY = 1024 #nodes between two time/node budget checks
+
+@dataclass
+class SearchResult:
+    best_move: Move | None
+    pv: list[Move] = field(default_factory=list)
+    score: int = 0 #centipawns for the side to move
+    depth: int = 0
+    seldepth: int = 0
+    nodes: int = 0
+    seconds: float = 0.0
+    book: bool = False #played from the opening book without searching
+
+    @property
+    def nps(self) -> int:
+        return int(self.nodes / self.seconds) if self.seconds > 0 else 0
+
+    @property
+    def mate_in(self) -> int | None:
+        """moves until mate, negative when the side to move gets mated"""
+        if abs(self.score) < MATE_BOUND:
+            return None
+        plies = MATE - abs(self.score)
+        return (plies + 1) // 2 if self.score > 0 else -(plies // 2)
+
+class _Stopped(Exception): pass
+
+class Search():
+    """Alpha-beta search with iterative deepening and quiescence on top of a Chess game
+
+    The game is searched in place with make_move/unmake_move and is left as it was found.
+    """
+    def __init__(self, game: chess.Chess, tt: TranspositionTable | SharedTranspositionTable | None = None, helper_id: int = 0):
+        self.game = game
+        self.tt = tt if tt is not None else TranspositionTable()
+        #helpers of a ParallelSearch leave aging the shared table to the main search, odd ones start a depth deeper
+        self.helper_id = helper_id
+        self.stop_event = None #anything with is_set(), checked with the time and node limits
+        self.book = None #chess_book.Book, positions in it are answered without searching
+        self.tablebase = None #chess_tablebase.Tablebase, positions in it end the search with their exact score
+
+        self.killers: list[list[Move | None]] = [[None, None] for _ in range(MAX_PLY)]
+        self.history: list[int] = [0] * 4096 #by from-to bits of the move
+        self.pv: list[list[Move]] = [[] for _ in range(MAX_PLY + 1)]
+
+        self.nodes = 0
+        self.seldepth = 0
+        self.stopped = False
+        self._deadline: float | None = None
+        self._node_limit: int | None = None
+
+    #======================PUBLIC METHODS======================
+
+    def search(self, max_depth: int | None = None, max_time: float | None = None, max_nodes: int | None = None,
+               on_iteration: Callable[[SearchResult], None] | None = None) -> SearchResult:
+        """Deepens until a limit is hit, the result of the last finished depth is returned"""
+        game = self.game
+        if game.status == chess.GameStatus.PROMOTING:
+            raise exceptions.InvalidMove("Must promote pawn first")
+
+        start = time.perf_counter()
+        self.nodes = 0
+        self.stopped = False
+        self._deadline = start + max_time if max_time is not None else None
+        self._node_limit = max_nodes
+        if not self.helper_id:
+            self.tt.new_search()
+        for killers in self.killers:
+            killers[0] = killers[1] = None
+
+        result = SearchResult(None)
+        moves = game.get_legal_moves()
+        if not moves:
+            return result
+        book_result = self._book_result()
+        if book_result is not None:
+            return book_result
+
+        history_size = len(game.history)
+        depth = self.helper_id % 2
+        try:
+            while depth < (max_depth or MAX_PLY - 1):
+                depth += 1
+                self.seldepth = 0
+                score = self._negamax(depth, -INFINITY, INFINITY, 0)
+
+                result = SearchResult(
+                    self.pv[0][0] if self.pv[0] else moves[0], list(self.pv[0]), score,
+                    depth, self.seldepth, self.nodes, time.perf_counter() - start,
+                )
+                if on_iteration is not None:
+                    on_iteration(result)
+                if abs(score) >= MATE_BOUND and MATE - abs(score) <= depth:
+                    break #found the shortest mate
+        except _Stopped:
+            pass
+        finally:
+            while len(game.history) > history_size:
+                game.unmake_move()
+
+        if result.best_move is None:
+            #stopped before depth 1 finished
+            result.best_move = moves[0]
+        result.nodes = self.nodes
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def stop(self):
+        """Makes a running search return as soon as possible"""
+        self.stopped = True
+
+    def evaluate(self) -> int:
+        """Static evaluation for the side to move, kept up to date by the game itself"""
+        return self.game.evaluate()
+
+    #======================PRIVATE METHODS======================
+
+    def _book_result(self) -> SearchResult | None:
+        if self.book is None:
+            return None
+        move = self.book.choose(self.game)
+        return SearchResult(move, [move], book=True) if move is not None else None
+
+    def _negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self._count_node(ply)
+        self.pv[ply] = []
+        game = self.game
+        key = game.zobrist_key
+        alpha_start = alpha
+
+        #a repetition inside the tree is scored as the draw it can be forced into
+        if ply > 0 and (game.halfmove_clock >= 100 or game.repetitions() > 1):
+            return 0
+        if ply > 0 and self.tablebase is not None:
+            value = self.tablebase.probe(game)
+            if value is not None:
+                return self._tablebase_score(value, ply)
+
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_score, bound, tt_move, _ = entry
+            if ply > 0 and tt_depth >= depth:
+                score = self._score_from_tt(tt_score, ply)
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    return score
+
+        in_check = game.is_in_check()
+        if in_check:
+            depth += 1 #check extension
+        if depth <= 0:
+            return self._quiescence(alpha, beta, ply)
+        if ply >= MAX_PLY - 1:
+            return self.evaluate()
+
+        moves = game.get_legal_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        best_score, best_move = -INFINITY, None
+        for move in self._order_moves(moves, tt_move, ply):
+            game.make_move(move)
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            game.unmake_move()
+
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        if not is_capture(move):
+                            self._store_killer(move, ply)
+                            self.history[move & 0xFFF] += depth * depth
+                        break
+
+        if best_score <= alpha_start:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, self._score_to_tt(best_score, ply), bound, best_move)
+        return best_score
+
+    def _quiescence(self, alpha: int, beta: int, ply: int) -> int:
+        """Only captures and queen promotions, so the static evaluation isn't taken mid exchange"""
+        self._count_node(ply)
+        stand_pat = self.evaluate()
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        game = self.game
+        moves = [move for move in game.get_legal_moves() if is_capture(move) or promotion_piece(move) == "Q"]
+        moves.sort(key=self._mvv_lva, reverse=True)
+
+        for move in moves:
+            game.make_move(move)
+            score = -self._quiescence(-beta, -alpha, ply + 1)
+            game.unmake_move()
+
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    #======================HELPERS======================
+
+    def _count_node(self, ply: int):
+        self.nodes += 1
+        self.seldepth = max(self.seldepth, ply)
+        if self.nodes % CHECK_EVERY == 0 or self.stopped:
+            if self.stopped:
+                raise _Stopped()
+            if self._node_limit is not None and self.nodes >= self._node_limit:
+                raise _Stopped()
+            if self._deadline is not None and time.perf_counter() >= self._deadline:
+                raise _Stopped()
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise _Stopped()
+
+    def _order_moves(self, moves: list[Move], tt_move: Move | None, ply: int) -> list[Move]:
+        killers = self.killers[ply]
+
+        def score(move: Move) -> int:
+            if move == tt_move:
+                return 1 << 30
+            if is_capture(move):
+                return (1 << 20) + self._mvv_lva(move)
+            promotion = promotion_piece(move)
+            if promotion is not None:
+                return (1 << 19) + PIECE_VALUES[promotion]
+            if move == killers[0] or move == killers[1]:
+                return 1 << 18
+            return self.history[move & 0xFFF]
+
+        return sorted(moves, key=score, reverse=True)
+
+    def _mvv_lva(self, move: Move) -> int:
+        """most valuable victim first, least valuable attacker as tie break"""
+        board = self.game.board
+        victim = board.get(SQUARES[move >> 6 & 0x3F])
+        victim_value = PIECE_VALUES.get(victim.abbreviation, 0) if victim else PIECE_VALUES["P"] #en passant
+        return 10 * victim_value - PIECE_VALUES.get(board[SQUARES[move & 0x3F]].abbreviation, 0)
+
+    def _store_killer(self, move: Move, ply: int):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    #mate scores are stored relative to the node so they stay right when found again at another ply
+    @staticmethod
+    def _tablebase_score(value: int, ply: int) -> int:
+        if value > 0:
+            return MATE - ply - (value - 1)
+        if value < 0:
+            return -MATE + ply + (-value - 1)
+        return 0
+
+    @staticmethod
+    def _score_to_tt(score: int, ply: int) -> int:
+        if score >= MATE_BOUND:
+            return score + ply
+        if score <= -MATE_BOUND:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _score_from_tt(score: int, ply: int) -> int:
+        if score >= MATE_BOUND:
+            return score - ply
+        if score <= -MATE_BOUND:
+            return score + ply
+        return score
+
+class ParallelSearch():
+    """Lazy SMP: helper processes search the same root and share one transposition table
+
+    The main search runs in this process on the game itself, so on_iteration and stop() work as
+    with Search. Helpers fill the shared table with results the main search picks up, when it
+    stops they are stopped too and the deepest finished result of all of them is returned.
+    """
+    def __init__(self, game: chess.Chess, processes: int | None = None, tt_size: int = 1 << 20):
+        self.game = game
+        self.processes = max(processes or os.cpu_count() or 1, 1)
+        self.tt = SharedTranspositionTable(tt_size)
+        self.main = Search(game, self.tt)
+
+        self._stop_event = multiprocessing.Event()
+        self._pool: ProcessPoolExecutor | None = None
+
+    @property
+    def book(self):
+        return self.main.book
+
+    @book.setter
+    def book(self, book):
+        self.main.book = book
+
+    @property
+    def tablebase(self):
+        return self.main.tablebase
+
+    @tablebase.setter
+    def tablebase(self, tablebase):
+        self.main.tablebase = tablebase
+
+    def __enter__(self) -> "ParallelSearch":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def search(self, max_depth: int | None = None, max_time: float | None = None, max_nodes: int | None = None,
+               on_iteration: Callable[[SearchResult], None] | None = None) -> SearchResult:
+        """Same limits as Search.search, max_nodes applies to every process on its own"""
+        game = self.game
+        if game.status == chess.GameStatus.PROMOTING:
+            raise exceptions.InvalidMove("Must promote pawn first")
+
+        book_result = self.main._book_result()
+        if book_result is not None:
+            return book_result
+
+        if self._pool is None and self.processes > 1:
+            self._pool = ProcessPoolExecutor(self.processes - 1, initializer=_init_helper, initargs=(self.tt, self._stop_event))
+
+        self._stop_event.clear()
+        moves = [record.move for record in game.history]
+        helpers = [
+            self._pool.submit(_helper_search, helper_id, game.start_fen, moves, max_depth, max_time, max_nodes, self.main.tablebase)
+            for helper_id in range(1, self.processes)
+        ] if self._pool is not None else []
+
+        try:
+            result = self.main.search(max_depth, max_time, max_nodes, on_iteration)
+        finally:
+            self._stop_event.set()
+            results = [helper.result() for helper in helpers]
+
+        best = result
+        for helper_result in results:
+            if helper_result.best_move is not None and helper_result.depth > best.depth:
+                best = helper_result
+        return SearchResult(
+            best.best_move, best.pv, best.score, best.depth, max(r.seldepth for r in results + [result]),
+            result.nodes + sum(r.nodes for r in results), result.seconds,
+        )
+
+    def stop(self):
+        self.main.stop()
+        self._stop_event.set()
+
+    def close(self):
+        if self._pool is not None:
+            self._stop_event.set()
+            self._pool.shutdown()
+            self._pool = None
+
+_helper_tt: SharedTranspositionTable | None = None
+_helper_stop = None
+
+def _init_helper(tt: SharedTranspositionTable, stop_event):
+    global _helper_tt, _helper_stop
+    _helper_tt, _helper_stop = tt, stop_event
+
+def _helper_search(helper_id: int, start_fen: str, moves: list[Move], max_depth: int | None,
+                   max_time: float | None, max_nodes: int | None, tablebase=None) -> SearchResult:
+    game = chess.Chess(start_fen, backend="bitboard")
+    for move in moves:
+        game.make_move(move)
+
+    search = Search(game, _helper_tt, helper_id)
+    search.stop_event = _helper_stop
+    search.tablebase = tablebase
+    return search.search(max_depth, max_time, max_nodes)
@@ -0,0 +1,538 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from array import array
+from dataclasses import dataclass
+from chess_bitboard import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, WHITE, BLACK, rook_attacks, bishop_attacks, iter_bits, square_index
+from chess_pieces import Pawn
+from utils.Vec2 import Vec2
+import chess
+import exceptions
+
+#a table holds one value per position of a material signature like KRvK or KQvKP:
+#
+#   0     draw
+#   > 0   the side to move mates in value - 1 plies
+#   < 0   the side to move gets mated in -value - 1 plies, -1 is checkmate
+#
+#castling and en passant are left out, positions with either aren't probed. the double pushes
+#that allow an en passant capture are still scored with it, so the positions before them are exact
+
+MAGIC = b"CHST"
+VERSION = 1
+EXTENSION = ".tb"
+
+_HEADER = struct.Struct("<4sHc")
+
+ORDER = "KQRBNP" #pieces of one side in names and indexes
+VALUES = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+MAX_PIECES = 4
+
+#generation states
+_UNKNOWN, _DONE, _INVALID = 0, 1, 2
+
+def table_name(white: str, black: str) -> str:
+    """Name of the table storing the material, the stronger side is always white in it"""
+    return "v".join(_orient(white, black)[:2])
+
+def _orient(white: str, black: str) -> tuple[str, str, bool]:
+    """(white, black, colours swapped) of the table storing the material"""
+    white = "".join(sorted(white, key=ORDER.index))
+    black = "".join(sorted(black, key=ORDER.index))
+    if _strength(black) > _strength(white):
+        return black, white, True
+    return white, black, False
+
+def _strength(kinds: str) -> tuple:
+    return sum(VALUES[kind] for kind in kinds), [-ORDER.index(kind) for kind in kinds]
+
+class Table():
+    """Index layout of one material signature, the values are filled by generate or read from a file
+
+    Squares are in name order, white pieces first. The white king is mirrored onto files a-d,
+    without pawns also onto ranks 1-4, which makes every position map to exactly one index.
+    """
+    def __init__(self, name: str, values=None):
+        self.white, _, self.black = name.partition("v")
+        if not self.white.startswith("K") or not self.black.startswith("K") or any(kind not in ORDER for kind in self.white + self.black):
+            raise exceptions.InvalidInput(f"Invalid table name {name!r}")
+        self.name = name
+        self.kinds = self.white + self.black
+        self.teams = (WHITE,) * len(self.white) + (BLACK,) * len(self.black)
+        self.kings = (0, len(self.white)) #index of the king of each team
+        self.pawns = "P" in self.kinds
+
+        self.king_squares = [sq for sq in range(64) if sq % 8 < 4 and (self.pawns or sq < 32)]
+        self.king_slots = [-1] * 64
+        for slot, sq in enumerate(self.king_squares):
+            self.king_slots[sq] = slot
+        self.size = 2 * len(self.king_squares) * 64 ** (len(self.kinds) - 1)
+        self.values = values
+
+    def __len__(self) -> int:
+        return self.size
+
+    def index(self, squares: list[int], side: int) -> int:
+        king = squares[0]
+        flip = (7 if king & 7 >= 4 else 0) | (56 if king >= 32 and not self.pawns else 0)
+        index = side * len(self.king_squares) + self.king_slots[king ^ flip]
+        for sq in squares[1:]:
+            index = index * 64 + (sq ^ flip)
+        return index
+
+    def decode(self, index: int) -> tuple[list[int], int]:
+        """(squares, side to move) of an index"""
+        squares = [0] * len(self.kinds)
+        for i in range(len(self.kinds) - 1, 0, -1):
+            index, squares[i] = divmod(index, 64)
+        side, slot = divmod(index, len(self.king_squares))
+        squares[0] = self.king_squares[slot]
+        return squares, side
+
+    def probe(self, squares: list[int], side: int) -> int:
+        return self.values[self.index(squares, side)]
+
+    def save(self, directory: str):
+        values = self.values
+        if all(-128 <= value < 128 for value in values):
+            values = array("b", values)
+        with open(os.path.join(directory, self.name + EXTENSION), "wb") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, values.typecode.encode("ascii")))
+            values.tofile(file)
+
+class Tablebase():
+    """Tables of a directory, each one is memory mapped the first time a position needs it"""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.tables: dict[str, Table | None] = {}
+        self._maps: list[mmap.mmap] = []
+
+    #workers of a process pool map the tables again themselves
+    def __getstate__(self) -> dict:
+        return {"directory": self.directory}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["directory"])
+
+    def __enter__(self) -> "Tablebase":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def table(self, name: str) -> Table | None:
+        if name not in self.tables:
+            self.tables[name] = self._load(name)
+        return self.tables[name]
+
+    def probe(self, game: chess.Chess) -> int | None:
+        """Value of the position for the side to move, None when it isn't covered"""
+        if len(game.board) > MAX_PIECES or game.castling_rights or _en_passant_possible(game):
+            return None
+        pieces = [(0 if piece.team == "WHITE" else 1, piece.abbreviation, square_index(pos)) for pos, piece in game.board.items()]
+        return self.probe_pieces(pieces, 0 if game.current_team == "WHITE" else 1)
+
+    def probe_pieces(self, pieces: list[tuple[int, str, int]], side: int) -> int | None:
+        """pieces are (team, abbreviation, square index)"""
+        if any(kind not in ORDER for _, kind, _ in pieces):
+            return None
+        pieces = sorted(pieces, key=lambda piece: (piece[0], ORDER.index(piece[1])))
+        white = "".join(kind for team, kind, _ in pieces if team == WHITE)
+        black = "".join(kind for team, kind, _ in pieces if team == BLACK)
+        if len(white) == len(black) == 1:
+            return 0
+
+        table_white, table_black, swapped = _orient(white, black)
+        table = self.table(f"{table_white}v{table_black}")
+        if table is None:
+            return None
+        if swapped:
+            squares = [sq ^ 56 for team, _, sq in pieces if team == BLACK] + [sq ^ 56 for team, _, sq in pieces if team == WHITE]
+            return table.probe(squares, side ^ 1)
+        return table.probe([sq for _, _, sq in pieces], side)
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None and isinstance(table.values, memoryview):
+                table.values.release()
+        for data in self._maps:
+            data.close()
+        self.tables.clear()
+        self._maps.clear()
+
+    def _load(self, name: str) -> Table | None:
+        path = os.path.join(self.directory, name + EXTENSION)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, typecode = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            data.close()
+            raise exceptions.InvalidInput(f"{path} is not a version {VERSION} tablebase")
+        self._maps.append(data)
+        return Table(name, memoryview(data)[_HEADER.size:].cast(typecode.decode("ascii")))
+
+def _en_passant_possible(game: chess.Chess) -> bool:
+    """a pawn just moved two squares and one of the side to move stands next to it"""
+    if not game.last_move or not isinstance(game.board.get(game.last_move[1]), Pawn):
+        return False
+    start, end = game.last_move
+    if abs(start.y - end.y) != 2:
+        return False
+    for x in (end.x - 1, end.x + 1):
+        piece = game.board.get(Vec2(x, end.y))
+        if isinstance(piece, Pawn) and piece.team == game.current_team:
+            return True
+    return False
+
+#======================GENERATION======================
+
+def generate(name: str, directory: str, verbose: bool = True) -> Table:
+    """Retrograde analysis of a table, the tables its captures and promotions lead to are generated first"""
+    os.makedirs(directory, exist_ok=True)
+    tablebase = Tablebase(directory)
+    try:
+        return _generate(Table(name), tablebase, verbose)
+    finally:
+        tablebase.close()
+
+def _generate(table: Table, tablebase: Tablebase, verbose: bool) -> Table:
+    for child in _child_names(table):
+        if tablebase.table(child) is None:
+            _generate(Table(child), tablebase, verbose)
+            tablebase.tables.pop(child) #load the saved one
+
+    start = time.perf_counter()
+    generator = _Generator(table, tablebase)
+    generator.run()
+    table.save(tablebase.directory)
+    if verbose:
+        print(f"{table.name}: {table.size} positions, longest mate {generator.longest} plies, {time.perf_counter() - start:.1f}s")
+    return table
+
+def _child_names(table: Table) -> list[str]:
+    """tables one capture or promotion away"""
+    names = set()
+    for i, kind in enumerate(table.kinds):
+        if kind != "K":
+            names.add(table_name(*_without(table, i)))
+        if kind == "P":
+            for promotion in "QRBN":
+                white, black = table.white, table.black
+                if i < len(white):
+                    white = white[:i] + promotion + white[i + 1:]
+                else:
+                    black = black[:i - len(white)] + promotion + black[i - len(white) + 1:]
+                names.add(table_name(white, black))
+                #a pawn that promotes by capturing
+                for j, other in enumerate(table.kinds):
+                    if other != "K" and table.teams[j] != table.teams[i]:
+                        names.add(table_name(*_without(Table(f"{white}v{black}"), j)))
+    return sorted(name for name in names if name != "KvK")
+
+def _without(table: Table, i: int) -> tuple[str, str]:
+    kinds = table.kinds[:i] + table.kinds[i + 1:]
+    split = len(table.white) - (i < len(table.white))
+    return kinds[:split], kinds[split:]
+
+class _Generator():
+    """Counting retrograde analysis
+
+    Every position counts its legal moves. Positions are resolved one ply level at a time: a loss at
+    level n makes every predecessor a win at n + 1, a win at level n takes one move off the count of
+    every predecessor and a predecessor whose count reaches 0 is a loss at n + 1. Captures and
+    promotions leave the table and are looked up in the child tables while counting.
+
+    A double push next to an enemy pawn leads to the stored position plus en passant captures, the
+    move is worth the better of the two and queued once both are known (_EnPassant).
+    """
+    def __init__(self, table: Table, tablebase: Tablebase):
+        self.table = table
+        self.tablebase = tablebase
+        self.values = array("h", bytes(2 * table.size))
+        self.state = bytearray(table.size)
+        self.remaining = bytearray(table.size)
+        #level -> positions, arrays since there can be as many entries as the table has positions
+        self.wins: dict[int, array] = {} #positions with a move to a lost position
+        self.losses: dict[int, array] = {} #positions with one more move to a won position
+        #position after the double push -> parent -> move, and the moves waiting for a level
+        self.en_passant: dict[int, dict[int, _EnPassant]] = {}
+        self.deadlines: dict[int, list[_EnPassant]] = {}
+        self.longest = 0
+
+    def run(self):
+        table, state, remaining = self.table, self.state, self.remaining
+        mated = []
+        for index in range(table.size):
+            squares, side = table.decode(index)
+            if not self._is_valid(squares, side):
+                state[index] = _INVALID
+                continue
+
+            count = 0
+            in_check = self._attacked(squares, squares[table.kings[side]], side ^ 1)
+            for child, moved, captured, promotion in self._moves(squares, side):
+                count += 1
+                if captured is None and promotion is None:
+                    if table.kinds[moved] == "P" and abs(child[moved] - squares[moved]) == 16:
+                        self._add_en_passant(index, child, side, moved)
+                    continue
+                value = self._child_value(child, side, moved, captured, promotion)
+                if value < 0:
+                    self.wins.setdefault(-value, array("I")).append(index)
+                elif value > 0:
+                    self.losses.setdefault(value, array("I")).append(index)
+            if count == 0:
+                state[index] = _DONE
+                if in_check:
+                    self.values[index] = -1
+                    mated.append(index)
+            remaining[index] = count
+
+        for child, moves in self.en_passant.items():
+            for move in moves.values():
+                if remaining[child] == 0:
+                    #no moves but the en passant captures, the stored mate or stalemate doesn't count
+                    self._queue_en_passant(move, move.capture)
+                elif move.capture > 0:
+                    self.deadlines.setdefault(move.capture, []).append(move)
+
+        self._resolve(mated, 0)
+        level = 1
+        while self.wins or self.losses or self.deadlines:
+            #the capture wins and nothing faster turned up
+            for move in self.deadlines.pop(level, ()):
+                self._queue_en_passant(move, level)
+            resolved = []
+            for index in self.wins.pop(level, ()):
+                if state[index] == _UNKNOWN:
+                    state[index] = _DONE
+                    self.values[index] = level + 1
+                    resolved.append(index)
+            for index in self.losses.pop(level, ()):
+                if state[index] == _UNKNOWN:
+                    remaining[index] -= 1
+                    if remaining[index] == 0:
+                        state[index] = _DONE
+                        self.values[index] = -level - 1
+                        resolved.append(index)
+            self._resolve(resolved, level)
+            level += 1
+        table.values = self.values
+
+    def _resolve(self, resolved: list[int], level: int):
+        """queues the predecessors of positions resolved at level"""
+        table, state = self.table, self.state
+        if resolved:
+            self.longest = level
+        for index in resolved:
+            value = self.values[index]
+            events = self.wins if value < 0 else self.losses
+            queue = events.setdefault(level + 1, array("I"))
+            squares, side = table.decode(index)
+            en_passant = self.en_passant.get(index, {})
+            for parent in self._unmoves(squares, side):
+                parent_index = table.index(parent, side ^ 1)
+                if state[parent_index] == _UNKNOWN and parent_index not in en_passant:
+                    queue.append(parent_index)
+            for move in en_passant.values():
+                #a capture that wins slower than value is already waiting in deadlines
+                if move.capture <= 0 or 0 < value <= move.capture:
+                    self._queue_en_passant(move, max(value, move.capture, key=_preference))
+
+    def _add_en_passant(self, parent: int, squares: list[int], side: int, pawn: int):
+        """records a double push of side's pawn that the other side can capture en passant"""
+        table = self.table
+        passed = squares[pawn] - (8 if side == WHITE else -8)
+        captures = []
+        for i, (team, kind) in enumerate(zip(table.teams, table.kinds)):
+            sq = squares[i]
+            if kind != "P" or team == side or sq // 8 != squares[pawn] // 8 or abs(sq % 8 - squares[pawn] % 8) != 1:
+                continue
+            child = squares.copy()
+            child[i] = passed
+            child[pawn] = -1
+            if self._attacked(child, child[table.kings[side ^ 1]], side):
+                continue
+            value = self._child_value(child, side ^ 1, i, pawn, None)
+            captures.append(-value + 1 if value < 0 else -value - 1 if value > 0 else 0)
+        if captures:
+            child = table.index(squares, side ^ 1)
+            self.en_passant.setdefault(child, {})[parent] = _EnPassant(parent, max(captures, key=_preference))
+
+    def _queue_en_passant(self, move: "_EnPassant", value: int):
+        """queues the parent of a double push worth value to the side that can capture"""
+        if move.queued:
+            return
+        move.queued = True
+        if value == 0 or self.state[move.parent] != _UNKNOWN:
+            return
+        events = self.losses if value > 0 else self.wins
+        events.setdefault(abs(value), array("I")).append(move.parent)
+
+    def _child_value(self, squares: list[int], side: int, moved: int, captured: int | None, promotion: str | None) -> int:
+        """value of a capture or promotion for the side to move after it"""
+        table = self.table
+        kinds = list(table.kinds)
+        if promotion is not None:
+            kinds[moved] = promotion
+        pieces = [(team, kind, sq) for i, (team, kind, sq) in enumerate(zip(table.teams, kinds, squares)) if i != captured]
+        value = self.tablebase.probe_pieces(pieces, side ^ 1)
+        if value is None:
+            raise exceptions.InvalidInput(f"{table.name} needs the tables its captures and promotions lead to")
+        return value
+
+    def _moves(self, squares: list[int], side: int):
+        """(squares after the move, moved piece, captured piece, promotion) of every legal move"""
+        table = self.table
+        occupied = 0
+        own = 0
+        for team, sq in zip(table.teams, squares):
+            occupied |= 1 << sq
+            if team == side:
+                own |= 1 << sq
+        king = table.kings[side]
+
+        for i, (team, kind) in enumerate(zip(table.teams, table.kinds)):
+            if team != side:
+                continue
+            sq = squares[i]
+            if kind == "P":
+                step = 8 if side == WHITE else -8
+                targets = PAWN_ATTACKS[side][sq] & occupied & ~own
+                if not occupied >> (sq + step) & 1:
+                    targets |= 1 << (sq + step)
+                    start_rank = 1 if side == WHITE else 6
+                    if sq // 8 == start_rank and not occupied >> (sq + 2 * step) & 1:
+                        targets |= 1 << (sq + 2 * step)
+            else:
+                targets = _attacks(kind, sq, occupied, side) & ~own
+
+            for target in iter_bits(targets):
+                child = squares.copy()
+                child[i] = target
+                captured = None
+                if occupied >> target & 1:
+                    captured = squares.index(target)
+                    child[captured] = -1
+                if self._attacked(child, child[king], side ^ 1):
+                    continue
+                if kind == "P" and target // 8 in (0, 7):
+                    for promotion in "QRBN":
+                        yield child, i, captured, promotion
+                else:
+                    yield child, i, captured, None
+
+    def _unmoves(self, squares: list[int], side: int):
+        """squares before every move that can have led here, side is the side to move now"""
+        table = self.table
+        mover = side ^ 1
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+
+        for i, (team, kind) in enumerate(zip(table.teams, table.kinds)):
+            if team != mover:
+                continue
+            sq = squares[i]
+            if kind == "P":
+                step = -8 if mover == WHITE else 8
+                origins = 0
+                back = sq + step
+                if 8 <= back < 56 and not occupied >> back & 1:
+                    origins |= 1 << back
+                    double_rank = 3 if mover == WHITE else 4
+                    if sq // 8 == double_rank and not occupied >> (back + step) & 1:
+                        origins |= 1 << (back + step)
+            else:
+                origins = _attacks(kind, sq, occupied, mover) & ~occupied
+
+            for origin in iter_bits(origins):
+                parent = squares.copy()
+                parent[i] = origin
+                #the side to move now can't have been in check before the move
+                if not self._attacked(parent, parent[table.kings[side]], mover):
+                    yield parent
+
+    def _is_valid(self, squares: list[int], side: int) -> bool:
+        table = self.table
+        if len(set(squares)) != len(squares):
+            return False
+        for kind, sq in zip(table.kinds, squares):
+            if kind == "P" and sq // 8 in (0, 7):
+                return False
+        #the side that just moved can't be in check
+        return not self._attacked(squares, squares[table.kings[side ^ 1]], side)
+
+    def _attacked(self, squares: list[int], target: int, by: int) -> bool:
+        table = self.table
+        occupied = 0
+        for sq in squares:
+            if sq >= 0:
+                occupied |= 1 << sq
+        for team, kind, sq in zip(table.teams, table.kinds, squares):
+            if team == by and sq >= 0 and _attacks(kind, sq, occupied, by) >> target & 1:
+                return True
+        return False
+
+@dataclass(slots=True)
+class _EnPassant():
+    """a double push that allows an en passant capture"""
+    parent: int
+    capture: int #value of the best capture for the side that can play it
+    queued: bool = False
+
+def _preference(value: int) -> tuple[int, int]:
+    """sort key of values for the side to move, the best one is the largest"""
+    if value > 0:
+        return 2, -value
+    if value < 0:
+        return 0, -value
+    return 1, 0
+
+def _attacks(kind: str, sq: int, occupied: int, team: int) -> int:
+    if kind == "K":
+        return KING_ATTACKS[sq]
+    if kind == "N":
+        return KNIGHT_ATTACKS[sq]
+    if kind == "P":
+        return PAWN_ATTACKS[team][sq]
+    if kind == "B":
+        return bishop_attacks(sq, occupied)
+    if kind == "R":
+        return rook_attacks(sq, occupied)
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+def main():
+    parser = argparse.ArgumentParser(description="Endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("generate", help="generate tables and the ones they depend on")
+    build.add_argument("tables", nargs="+", help="e.g. KQvK KRvK KPvK")
+    build.add_argument("--dir", default="tables")
+
+    probe = commands.add_parser("probe", help="print the value of a position")
+    probe.add_argument("fen")
+    probe.add_argument("--dir", default="tables")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        for name in args.tables:
+            if len(name) - 1 > MAX_PIECES:
+                parser.error(f"{name} has more than {MAX_PIECES} pieces")
+            generate(table_name(*name.split("v")), args.dir)
+    else:
+        with Tablebase(args.dir) as tablebase:
+            value = tablebase.probe(chess.Chess(args.fen))
+            if value is None:
+                print("not in the tablebase")
+            elif value == 0:
+                print("draw")
+            else:
+                print(f"{'win' if value > 0 else 'loss'}, mate in {abs(value) - 1} plies")
+
+if __name__ == "__main__":
+    main()
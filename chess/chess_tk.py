@@ -1,60 +1,95 @@
 import tkinter as tk
+from tkinter import filedialog
 from typing import Any
 from PIL import Image, ImageTk
-from os import path
+from os import listdir, path
 from utils.Vec2 import Vec2
+from chess_pieces import Piece
 import chess
+import chess_analysis
+import chess_pgn
+from chess_move import decode
+from chess_search import SearchResult
 import exceptions
 
-root = tk.Tk()
-
 WIDTH = 500
 HEIGTH = 500
 SOUND = True
 
-FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR"
+ENGINE_TEAM = None #"WHITE" or "BLACK" to play against the engine
+ENGINE_TIME = 1.0 #seconds per engine move
+ENGINE_BOOK = None #path of an opening book made with `python chess_book.py build games.pgn book.bin`
+ENGINE_TABLES = None #directory of endgame tables made with `python chess_tablebase.py generate KQvK KRvK KPvK`
+ANALYSIS = False #analyse the position while it's the player's turn, "a" toggles it
+
+POLL_MS = 16 #how often engine results are picked up, a frame at 60 fps
 
-root.geometry("500x500")
-canvas = tk.Canvas(root, bg="white", width=WIDTH, height=HEIGTH)
-canvas.pack(fill="both", expand=True) 
-root.update()
- 
-size = Vec2(WIDTH//8, HEIGTH//8)
+FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 
 try:
-    has_pygame = False
-    if SOUND:
-        import pygame
-        has_pygame = True
-        pygame.mixer.init()
-        
+    import pygame
 except ImportError:
-    has_pygame = False
-    print("has_pygame is not installed. No sound will be played.")
-
-def play_sound(sound_name):
-    if not has_pygame and not SOUND:
-        return
-    
-    sound_path = path.join(f"sounds/{sound_name}")
-    if not path.exists(sound_path):
-        print("No file found")
-        return
-    
-    try:
-        s = pygame.mixer.Sound(sound_path)
-        s.play()
-    except pygame.error as e:
-        print(f"[ERROR sound]: {e}")
+    pygame = None
+
+class SoundBank():
+    """Every effect of a directory decoded once at startup and played from memory
+
+    Without pygame, an audio device or with enabled=False nothing is loaded and play does nothing.
+    """
+    def __init__(self, directory: str = "sounds", enabled: bool = True):
+        self.sounds: dict[str, Any] = {} #file name -> pygame.mixer.Sound, None once reported missing
+        self.enabled = enabled and self._init_mixer()
+        if not self.enabled:
+            return
+
+        for name in sorted(listdir(directory)) if path.isdir(directory) else []:
+            try:
+                self.sounds[name] = pygame.mixer.Sound(path.join(directory, name))
+            except pygame.error as e:
+                print(f"[ERROR sound]: {name}: {e}")
+
+    def play(self, name: str):
+        if not self.enabled:
+            return
+        sound = self.sounds.get(name)
+        if sound is None:
+            if name not in self.sounds:
+                print(f"No sound file {name}")
+                self.sounds[name] = None
+            return
+        sound.play()
+
+    @staticmethod
+    def _init_mixer() -> bool:
+        if pygame is None:
+            print("pygame is not installed. No sound will be played.")
+            return False
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            print(f"[ERROR sound]: {e}")
+            return False
+        return True
 
 class ChessTk():
-    def __init__(self, canvas: tk.Canvas, FEN: str, cell_size: Vec2 = Vec2(100,100), rotate_on_each_move: bool = False):
+    def __init__(self, canvas: tk.Canvas, FEN: str, cell_size: Vec2 = Vec2(100,100), rotate_on_each_move: bool = False,
+                 engine_team: str | None = None, engine_time: float = 1.0, engine_book: str | None = None, engine_tables: str | None = None,
+                 analysis: bool = False, sound: bool = True):
         self.canvas = canvas
-        self.game = chess.Chess(FEN)
+        self.sounds = SoundBank("sounds", sound)
+        self.game = chess.Chess(FEN, backend="bitboard")
+        #searches run in a worker process and are polled from the main loop, so the board never waits for them
+        self.analyzer = chess_analysis.Analyzer(engine_book, engine_tables)
+        self.engine_team = engine_team
+        self.engine_time = engine_time
+        self.analysis = analysis
+        self._engine_job: int | None = None #job of the engine move being searched
+        self._title = canvas.winfo_toplevel().title()
         self.cell_size = cell_size
         self.grid_size = Vec2(8 * cell_size.x, 8 * cell_size.y)
 
-        self.images = []
+        #(abbreviation, team, cell width, cell height) -> image, pieces are read and resampled once per size
+        self.sprites: dict[tuple[str, str, int, int], ImageTk.PhotoImage] = {}
 
         self._drag_start = Vec2(0, 0)
         self._drag_threshold = 5
@@ -72,11 +107,24 @@ class ChessTk():
 
         canvas.tag_bind("piece", "<Enter>", self._on_enter)
         canvas.tag_bind("piece", "<Leave>", self._on_leave)
+        canvas.winfo_toplevel().bind("<Control-s>", self._save_pgn)
+        canvas.winfo_toplevel().bind("<KeyPress-a>", self._toggle_analysis)
         self._create_board()
+        self._start_engine()
+        self.canvas.after(POLL_MS, self._poll)
+
+    def close(self):
+        self.analyzer.close()
+
+    def _save_pgn(self, event=None):
+        filename = filedialog.asksaveasfilename(defaultextension=".pgn", filetypes=[("PGN", "*.pgn")])
+        if not filename:
+            return
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write(chess_pgn.game_to_pgn(self.game, {"Event": "Tk game"}))
 
     def _move(self, pos_1: Vec2, pos_2: Vec2) -> Vec2:
         if pos_1 == pos_2: return pos_1
-        cw, ch = self.cell_size.x, self.cell_size.y
         capture = False
         try:
             self.game.move(pos_1, pos_2)
@@ -86,55 +134,128 @@ class ChessTk():
 
             if self.piece_selected_start_pos is None:
                 return pos_1
-            
-            piece_id = self.pieces_ids.pop(self.piece_selected_start_pos)
-            
-            if pos_2 in self.pieces_ids:
-                capture = True
-                captured_id = self.pieces_ids.pop(pos_2)
-                self.canvas.delete(captured_id)
-            else:
-                ep_pos = Vec2(pos_2.x, pos_1.y)
-                if pos_1.x != pos_2.x and ep_pos in self.pieces_ids and ep_pos not in self.game.board:
-                    capture = True
-                    captured_id = self.pieces_ids.pop(ep_pos)
-                    self.canvas.delete(captured_id)
-            # ------------------------------------------
-
-            self.pieces_ids[pos_2] = piece_id
-
-            vis_pos = self._reverse(pos_2)
-            highlight_colors = ("#F5F682", "#B9CA43") 
-            highlight_color = highlight_colors[(vis_pos.y + vis_pos.x) % 2]
 
-            self.canvas.create_rectangle(
-                (vis_pos.x-1)*cw, (vis_pos.y-1)*ch, 
-                (vis_pos.x)*cw, (vis_pos.y)*ch, 
-                fill=highlight_color, outline="", tags="highlight"
-            )
-            self.canvas.tag_raise("highlight", "square")
+            capture = self._apply_changes(self.game.last_changes())
+            self._highlight_square(pos_2)
+            self._play_move_sound(capture)
 
-            if self.game.status == chess.GameStatus.CHECK:
-                play_sound("check.mp3")
-            elif self.game.status == chess.GameStatus.CHECKMATE:
-                play_sound("game-end.mp3")
-            elif capture:
-                play_sound("capture.mp3")
-            else:
-                play_sound("move.mp3")
+            self._start_engine()
             return pos_2
 
         except exceptions.InvalidMove as e:
             print(f"[ERROR] {e}")
-            play_sound("illegal.mp3")
+            self.sounds.play("illegal.mp3")
 
         return pos_1
 
+    def _start_engine(self):
+        """Hands the position to the worker: a move to find on the engine's turn, else analysis if it is on"""
+        self.canvas.delete("analysis")
+        self._engine_job = None
+        if self.game.status in chess.GAME_OVER:
+            self.analyzer.stop()
+        elif self.game.current_team == self.engine_team:
+            self._engine_job = self.analyzer.start(self.game, max_time=self.engine_time)
+        elif self.analysis:
+            self.analyzer.start(self.game)
+        else:
+            self.analyzer.stop()
+
+    def _poll(self):
+        updates, final = self.analyzer.poll()
+        if self._engine_job is not None:
+            if final is not None:
+                self._play_engine_move(final)
+        elif updates or final is not None:
+            self._show_analysis(final if final is not None else updates[-1])
+        self.canvas.after(POLL_MS, self._poll)
+
+    def _toggle_analysis(self, event=None):
+        self.analysis = not self.analysis
+        if self._engine_job is None:
+            self._start_engine()
+        if not self.analysis:
+            self.canvas.winfo_toplevel().title(self._title)
+
+    def _show_analysis(self, result: SearchResult):
+        if result.best_move is None:
+            return
+        score = f"mate {result.mate_in}" if result.mate_in is not None else f"{result.score / 100:+.2f}"
+        san = chess_pgn.to_san(self.game, result.best_move)
+        self.canvas.winfo_toplevel().title(f"{san}  {score}  depth {result.depth}")
+
+        #arrow from the centre of one square to the other, it lets clicks through to the board
+        self.canvas.delete("analysis")
+        pos_1, pos_2, _ = decode(result.best_move)
+        cw, ch = self.cell_size.x, self.cell_size.y
+        (x1, y1), (x2, y2) = ((p.x * cw - cw // 2, p.y * ch - ch // 2) for p in map(self._reverse, (pos_1, pos_2)))
+        self.canvas.create_line(x1, y1, x2, y2, arrow=tk.LAST, width=max(cw // 8, 2), arrowshape=(cw // 3, cw // 3, cw // 8),
+                                fill="#E08A22", state="disabled", tags="analysis")
+
+    def _play_engine_move(self, result: SearchResult):
+        self._engine_job = None
+        if result.best_move is None:
+            return
+
+        pos_1, pos_2, promotion = decode(result.best_move)
+        self.game.play(result.best_move)
+        if promotion:
+            self.sounds.play("promote.mp3")
+
+        capture = self._apply_changes(self.game.last_changes())
+        self.canvas.delete("highlight")
+        self._highlight_square(pos_1)
+        self._highlight_square(pos_2)
+        self._play_move_sound(capture)
+        self._start_engine()
+
+    def _apply_changes(self, changes: list[chess.BoardChange]) -> bool:
+        """Edits only the pieces a move touched, True if one was captured"""
+        cw, ch = self.cell_size.x, self.cell_size.y
+        for change in changes:
+            if change.kind == "remove":
+                self.canvas.delete(self.pieces_ids.pop(change.pos))
+            elif change.kind == "move" and change.to is not None:
+                piece_id = self.pieces_ids.pop(change.pos)
+                vis_pos = self._reverse(change.to)
+                self.canvas.coords(piece_id, (vis_pos.x * cw) - cw // 2, (vis_pos.y * ch) - ch // 2)
+                self.pieces_ids[change.to] = piece_id
+            elif change.piece is not None:
+                self._create_piece(change.pos, change.piece)
+        #a capture always comes first, the remove of a promotion comes after the move
+        return bool(changes) and changes[0].kind == "remove"
+
+    def _highlight_square(self, pos: Vec2):
+        cw, ch = self.cell_size.x, self.cell_size.y
+        vis_pos = self._reverse(pos)
+        highlight_colors = ("#F5F682", "#B9CA43") 
+        highlight_color = highlight_colors[(vis_pos.y + vis_pos.x) % 2]
+
+        self.canvas.create_rectangle(
+            (vis_pos.x-1)*cw, (vis_pos.y-1)*ch, 
+            (vis_pos.x)*cw, (vis_pos.y)*ch, 
+            fill=highlight_color, outline="", tags="highlight"
+        )
+        self.canvas.tag_raise("highlight", "square")
+
+    def _play_move_sound(self, capture: bool):
+        if self.game.status == chess.GameStatus.CHECK:
+            self.sounds.play("check.mp3")
+        elif self.game.status in chess.GAME_OVER:
+            self.sounds.play("game-end.mp3")
+        elif capture:
+            self.sounds.play("capture.mp3")
+        else:
+            self.sounds.play("move.mp3")
+
     def _handle_promotion(self):
-        play_sound("promote.mp3")
+        self.sounds.play("promote.mp3")
         self.game.promote("Q")
 
     def _on_mouse_down(self, event):
+        if self.game.current_team == self.engine_team or self.game.status in chess.GAME_OVER:
+            return
+
         canvas_x = self.canvas.canvasx(event.x)
         canvas_y = self.canvas.canvasy(event.y)
 
@@ -153,9 +274,6 @@ class ChessTk():
 
             self.canvas.coords(self.piece_selected_id, target_x, target_y)
 
-            if self.piece_selected_start_pos != target:
-                self._check_board()
-
             for vec, hint in self.hint_ids.items(): self.canvas.delete(hint)
 
             self.hint_ids.clear()
@@ -231,50 +349,49 @@ class ChessTk():
             target_x, target_y = (vis_pos.x * cw) - cw//2, (vis_pos.y * ch) - ch//2
 
             self.canvas.coords(self.piece_selected_id, target_x, target_y)
-            if self.piece_selected_start_pos != target:
-                self._check_board()            
-                
+
             for vec, hint in self.hint_ids.items(): self.canvas.delete(hint)
 
             self.hint_ids.clear()
             self.piece_selected_id = self.piece_selected_start_pos = self._is_dragging= None
       
-    def _create_board(self, rebuild=False):
+    def _create_board(self):
         cw, ch = self.cell_size.x, self.cell_size.y
         colors = ("#EEEED2", "#769656")
 
-        if not rebuild:
-            for y in range(8):
-                for x in range(8):
-                    color = colors[(y + x) % 2]
-                    self.canvas.create_rectangle(
-                        x*cw, y*ch, (x+1)*cw, (y+1)*ch, 
-                        fill=color, outline="", tags="square"
-                    )
-        else:
-            for piece_id in self.pieces_ids.values():
-                self.canvas.delete(piece_id)
-
-            self.pieces_ids.clear()
-            self.images.clear()
-
-            self.canvas.delete("hint")
-            self.canvas.delete("highlight")
-            self.hint_ids.clear()
+        for y in range(8):
+            for x in range(8):
+                color = colors[(y + x) % 2]
+                self.canvas.create_rectangle(
+                    x*cw, y*ch, (x+1)*cw, (y+1)*ch, 
+                    fill=color, outline="", tags="square"
+                )
 
         for pos, piece in self.game.board.items():
-            team =  "w" if piece.team=="WHITE" else 'b'
-            filename = path.join("img", f"{team}{piece.abbreviation.lower()}.png")
-            piece_img = Image.open(filename).resize((cw, ch), Image.LANCZOS) # type: ignore
-            photo_image = ImageTk.PhotoImage(piece_img)
+            self._create_piece(pos, piece)
 
-            vis_pos = self._reverse(pos)
-            self.images.append(photo_image)
+    def _create_piece(self, pos: Vec2, piece: Piece):
+        cw, ch = self.cell_size.x, self.cell_size.y
+        team =  "w" if piece.team=="WHITE" else 'b'
+        vis_pos = self._reverse(pos)
+
+        x = (vis_pos.x * cw) - cw // 2
+        y = (vis_pos.y * ch) - ch // 2
+        img_id = self.canvas.create_image(x, y, image=self._sprite(piece), tags=("piece", f"{team}{piece.abbreviation.lower()}"))
+        self.pieces_ids[pos] = img_id
 
-            x = (vis_pos.x * cw) - cw // 2
-            y = (vis_pos.y * ch) - ch // 2
-            img_id = self.canvas.create_image(x, y, image=photo_image, tags=("piece", f"{team}{piece.abbreviation.lower()}"))
-            self.pieces_ids[pos] = img_id
+    def _sprite(self, piece: Piece) -> ImageTk.PhotoImage:
+        """image of the piece at the current cell size, from disk only the first time"""
+        cw, ch = self.cell_size.x, self.cell_size.y
+        key = (piece.abbreviation, piece.team, cw, ch)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            if self.sprites and next(iter(self.sprites))[2:] != (cw, ch):
+                self.sprites.clear() #cell size changed, the old images won't be drawn again
+            team = "w" if piece.team == "WHITE" else "b"
+            filename = path.join("img", f"{team}{piece.abbreviation.lower()}.png")
+            sprite = self.sprites[key] = ImageTk.PhotoImage(Image.open(filename).resize((cw, ch), Image.LANCZOS)) # type: ignore
+        return sprite
 
     def _on_enter(self, event):
         self.canvas.config(cursor="hand2") 
@@ -282,29 +399,27 @@ class ChessTk():
     def _on_leave(self, event):
         self.canvas.config(cursor="")
 
-    def _check_board(self):
-        for pos in list(self.pieces_ids.keys()):
-            if pos not in self.game.board:
-                self._create_board(rebuild=True)
-
-        for pos, engine_piece in self.game.board.items():
-            if pos not in self.pieces_ids:
-                self._create_board(rebuild=True); 
-
-            gui_id = self.pieces_ids[pos]
-            all_tags = self.canvas.gettags(gui_id)
-
-            team = "w" if engine_piece.team == "WHITE" else "b"
-            expected_tag = f"{team}{engine_piece.abbreviation.lower()}"
-
-            if expected_tag not in all_tags:
-                self._create_board(rebuild=True)
-               
-
     @staticmethod
     def _reverse(pos: Vec2) -> Vec2:
         return Vec2(pos.x, 9 - pos.y)
 
-AAAA = ChessTk(canvas=canvas, FEN=FEN, cell_size=size)
-
-root.mainloop()
+def main():
+    root = tk.Tk()
+    root.geometry("500x500")
+    canvas = tk.Canvas(root, bg="white", width=WIDTH, height=HEIGTH)
+    canvas.pack(fill="both", expand=True)
+    root.update()
+
+    size = Vec2(WIDTH//8, HEIGTH//8)
+    app = ChessTk(canvas=canvas, FEN=FEN, cell_size=size, engine_team=ENGINE_TEAM, engine_time=ENGINE_TIME,
+                  engine_book=ENGINE_BOOK, engine_tables=ENGINE_TABLES, analysis=ANALYSIS, sound=SOUND)
+
+    def on_close():
+        app.close()
+        root.destroy()
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    root.mainloop()
+
+#the engine's worker process may import this module again, it must not open a second window
+if __name__ == "__main__":
+    main()
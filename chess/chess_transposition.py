@@ -0,0 +1,172 @@
+import ctypes
+from multiprocessing.sharedctypes import RawArray
+from typing import Any
+
+EXACT, LOWER, UPPER = 0, 1, 2 #bound of the stored score
+NO_DEPTH = -1 #entry only holds a static evaluation
+
+class TranspositionTable():
+    """Fixed-size table of search and evaluation results keyed by zobrist key
+
+    Every index holds two slots: the first keeps the deepest result of the current search,
+    the second is always replaced, so shallow results still get cached without pushing out
+    expensive ones. Entries from an older search (see new_search) are replaced first.
+    """
+    def __init__(self, size: int = 1 << 18):
+        buckets = 1 << max(size // 2, 1).bit_length() - 1
+        self.mask = buckets - 1
+        #(key, depth, score, bound, move, static_eval, generation)
+        self.slots: list[tuple | None] = [None] * (2 * buckets)
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def new_search(self):
+        self.generation = (self.generation + 1) & 0xFF
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+        self.generation = 0
+
+    def probe(self, key: int) -> tuple | None:
+        """(depth, score, bound, move, static_eval) stored for the key"""
+        index = (key & self.mask) << 1
+        for entry in (self.slots[index], self.slots[index + 1]):
+            if entry is not None and entry[0] == key:
+                return entry[1:6]
+        return None
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: Any = None, static_eval: int | None = None):
+        index = (key & self.mask) << 1
+        deep = self.slots[index]
+
+        #keep what an older entry of the same position knew if the new one doesn't
+        for old in (deep, self.slots[index + 1]):
+            if old is not None and old[0] == key:
+                move = move if move is not None else old[4]
+                static_eval = static_eval if static_eval is not None else old[5]
+
+        entry = (key, depth, score, bound, move, static_eval, self.generation)
+        if deep is None or depth >= deep[1] or deep[6] != self.generation:
+            self.slots[index] = entry
+        else:
+            self.slots[index + 1] = entry
+
+    def store_eval(self, key: int, static_eval: int):
+        self.store(key, NO_DEPTH, 0, EXACT, None, static_eval)
+
+    def probe_eval(self, key: int) -> int | None:
+        index = (key & self.mask) << 1
+        for entry in (self.slots[index], self.slots[index + 1]):
+            if entry is not None and entry[0] == key and entry[5] is not None:
+                return entry[5]
+        return None
+
+    def hashfull(self) -> int:
+        """permille of the first 1000 slots used by the current search"""
+        sample = self.slots[:1000]
+        return sum(1 for entry in sample if entry is not None and entry[6] == self.generation) * 1000 // len(sample)
+
+class SharedTranspositionTable():
+    """TranspositionTable in shared memory, worker processes given the table search with the same entries
+
+    Moves must be chess_move ints. Every slot is three uint64: the key xor'ed with both data words,
+    then the data. A slot torn by two processes writing at once no longer matches its key and is
+    treated as a miss, so no locking is needed.
+    """
+    _USED = 1 << 34
+    _NO_EVAL = 1 << 31
+
+    def __init__(self, size: int = 1 << 18):
+        buckets = 1 << max(size // 2, 1).bit_length() - 1
+        self.mask = buckets - 1
+        #word 0 is the generation, slots follow
+        self._memory = RawArray(ctypes.c_uint64, 1 + 3 * 2 * buckets)
+        self._attach()
+
+    #workers get the shared array itself when the pool starts, not a copy
+    def __getstate__(self) -> dict:
+        return {"mask": self.mask, "_memory": self._memory}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._attach()
+
+    def _attach(self):
+        self.words = memoryview(self._memory).cast("B").cast("Q")
+
+    @property
+    def generation(self) -> int:
+        return self.words[0]
+
+    def __len__(self) -> int:
+        return 2 * (self.mask + 1)
+
+    def new_search(self):
+        self.words[0] = (self.words[0] + 1) & 0xFF
+
+    def clear(self):
+        ctypes.memset(self._memory, 0, ctypes.sizeof(self._memory))
+
+    def probe(self, key: int) -> tuple | None:
+        """(depth, score, bound, move, static_eval) stored for the key"""
+        entry = self._read(key)
+        return entry[:5] if entry is not None else None
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: Any = None, static_eval: int | None = None):
+        words = self.words
+        index = 1 + 6 * (key & self.mask)
+
+        #keep what an older entry of the same position knew if the new one doesn't
+        old = self._read(key)
+        if old is not None:
+            move = move if move is not None else old[3]
+            static_eval = static_eval if static_eval is not None else old[4]
+
+        generation = words[0]
+        data = (move or 0) | (depth + 1 & 0xFF) << 16 | bound << 24 | generation << 26 | self._USED
+        values = (score & 0xFFFFFFFF) | ((static_eval if static_eval is not None else -self._NO_EVAL) & 0xFFFFFFFF) << 32
+
+        deep_data = words[index + 1]
+        deep_depth = (deep_data >> 16 & 0xFF) - 1
+        if not deep_data & self._USED or depth >= deep_depth or deep_data >> 26 & 0xFF != generation:
+            slot = index
+        else:
+            slot = index + 3
+        words[slot + 1] = data
+        words[slot + 2] = values
+        words[slot] = key ^ data ^ values
+
+    def store_eval(self, key: int, static_eval: int):
+        self.store(key, NO_DEPTH, 0, EXACT, None, static_eval)
+
+    def probe_eval(self, key: int) -> int | None:
+        entry = self._read(key)
+        return entry[4] if entry is not None else None
+
+    def hashfull(self) -> int:
+        """permille of the first 1000 slots used by the current search"""
+        words, generation = self.words, self.words[0]
+        sample = min(1000, len(self))
+        used = sum(1 for slot in range(sample) if words[2 + 3 * slot] & self._USED and words[2 + 3 * slot] >> 26 & 0xFF == generation)
+        return used * 1000 // sample
+
+    def _read(self, key: int) -> tuple | None:
+        """(depth, score, bound, move, static_eval) of the slot holding the key"""
+        words = self.words
+        index = 1 + 6 * (key & self.mask)
+        for slot in (index, index + 3):
+            data, values = words[slot + 1], words[slot + 2]
+            if data & self._USED and words[slot] ^ data ^ values == key:
+                score = values & 0xFFFFFFFF
+                static_eval = values >> 32
+                static_eval = static_eval - (1 << 32) if static_eval & self._NO_EVAL else static_eval
+                return (
+                    (data >> 16 & 0xFF) - 1,
+                    score - (1 << 32) if score & 0x80000000 else score,
+                    data >> 24 & 0x3,
+                    data & 0xFFFF or None,
+                    None if static_eval == -self._NO_EVAL else static_eval,
+                )
+        return None
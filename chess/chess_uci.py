@@ -0,0 +1,251 @@
+import sys
+import threading
+from typing import IO
+from chess_fen import STARTING_FEN
+from chess_move import to_uci, from_uci
+from chess_transposition import TranspositionTable
+from chess_search import Search, ParallelSearch, SearchResult
+import chess
+import chess_book
+import chess_tablebase
+import exceptions
+
+#python chess_uci.py, then add it as an engine to any UCI GUI or tournament manager
+#stdin is read on the main thread while searches run on their own, so stop and isready are answered right away
+
+NAME = "python chess"
+AUTHOR = "Mario91457"
+
+MOVE_OVERHEAD = 0.05 #seconds kept back for the GUI and the pipe
+MOVES_TO_GO = 30 #assumed moves left when the GUI doesn't say
+HASH_ENTRY_BYTES = 128 #rough size of one table entry, to turn the Hash option into entries
+
+class UciEngine():
+    def __init__(self, output: IO[str] = sys.stdout):
+        self.output = output
+        self._output_lock = threading.Lock()
+
+        self.game = chess.Chess(STARTING_FEN, backend="bitboard")
+        self.options = {"Hash": 16, "Threads": 1, "BookFile": "", "TablebasePath": ""}
+        self.searcher: Search | ParallelSearch = self._create_searcher()
+
+        self._thread: threading.Thread | None = None
+        self._timer: threading.Timer | None = None
+        self._stop_requested = threading.Event()
+        self._infinite = False #bestmove waits for stop or ponderhit
+        self._ponder_budget: float | None = None
+
+    #======================PUBLIC METHODS======================
+
+    def run(self, source: IO[str] = sys.stdin):
+        for line in source:
+            if not self.handle(line):
+                break
+        self.handle("quit")
+
+    def handle(self, line: str) -> bool:
+        """Runs one command, False once the engine should exit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        try:
+            if command == "uci":
+                self._uci()
+            elif command == "isready":
+                self.send("readyok")
+            elif command == "setoption":
+                self._set_option(args)
+            elif command == "ucinewgame":
+                self._stop_search()
+                self._replace_searcher()
+            elif command == "position":
+                self._position(args)
+            elif command == "go":
+                self._go(args)
+            elif command == "stop":
+                self._stop_search()
+            elif command == "ponderhit":
+                self._ponderhit()
+            elif command == "quit":
+                self._stop_search()
+                if isinstance(self.searcher, ParallelSearch):
+                    self.searcher.close()
+                return False
+            else:
+                self.send(f"info string unknown command {command}")
+        except (exceptions.InvalidBoard, exceptions.InvalidMove, exceptions.InvalidInput, ValueError) as e:
+            self.send(f"info string {e}")
+        return True
+
+    def send(self, line: str):
+        with self._output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    #======================COMMANDS======================
+
+    def _uci(self):
+        self.send(f"id name {NAME}")
+        self.send(f"id author {AUTHOR}")
+        self.send("option name Hash type spin default 16 min 1 max 4096")
+        self.send("option name Threads type spin default 1 min 1 max 64")
+        self.send("option name BookFile type string default <empty>")
+        self.send("option name TablebasePath type string default <empty>")
+        self.send("option name Ponder type check default false")
+        self.send("uciok")
+
+    def _set_option(self, args: list[str]):
+        #setoption name <id> [value <x>], names and values can contain spaces
+        text = " ".join(args)
+        name, _, value = text.removeprefix("name ").partition(" value ")
+        name, value = name.strip(), value.strip()
+        if value == "<empty>":
+            value = ""
+        if name == "Ponder":
+            return
+        if name not in self.options:
+            raise exceptions.InvalidInput(f"unknown option {name}")
+
+        self._stop_search()
+        self.options[name] = int(value) if name in ("Hash", "Threads") else value
+        self._replace_searcher()
+
+    def _position(self, args: list[str]):
+        #position startpos | fen <fen> [moves <move> ...]
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        if args[:1] == ["startpos"]:
+            fen = STARTING_FEN
+        elif args[:1] == ["fen"]:
+            fen = " ".join(args[1:])
+        else:
+            raise exceptions.InvalidInput("position needs startpos or fen")
+
+        #a new game every time, a search still running keeps the old one to itself
+        game = chess.Chess(fen, backend="bitboard")
+        for text in moves:
+            move = from_uci(text, game.get_legal_moves())
+            if move is None:
+                raise exceptions.InvalidMove(f"illegal move {text}")
+            game.make_move(move)
+        self.game = game
+
+    def _go(self, args: list[str]):
+        self._stop_search()
+        limits: dict[str, int] = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ("infinite", "ponder"):
+                flags.add(args[i])
+            elif args[i] == "searchmoves":
+                break #not supported, the rest are moves
+            elif i + 1 < len(args) and args[i + 1].lstrip("-").isdigit():
+                limits[args[i]] = int(args[i + 1])
+                i += 1
+            i += 1
+
+        budget = self._budget(limits)
+        self._stop_requested.clear()
+        self._infinite = bool(flags)
+        self._ponder_budget = budget if "ponder" in flags else None
+
+        searcher = self.searcher
+        searcher.game = self.game
+        if isinstance(searcher, ParallelSearch):
+            searcher.main.game = self.game
+
+        #the search's own deadline is only checked every few nodes, the timer gets it out sooner
+        max_time = budget if not flags else None
+        self._thread = threading.Thread(
+            target=self._search, args=(searcher, limits.get("depth"), max_time, limits.get("nodes")), daemon=True,
+        )
+        self._thread.start()
+        if max_time is not None:
+            self._start_timer(max_time)
+
+    def _ponderhit(self):
+        #the predicted move was played, the ponder search goes on as a normal timed one
+        budget, self._ponder_budget = self._ponder_budget, None
+        self._infinite = False
+        self._stop_requested.set()
+        if budget is not None:
+            self._start_timer(budget)
+
+    #======================PRIVATE METHODS======================
+
+    def _replace_searcher(self):
+        if isinstance(self.searcher, ParallelSearch):
+            self.searcher.close()
+        self.searcher = self._create_searcher()
+
+    def _create_searcher(self) -> Search | ParallelSearch:
+        size = self.options["Hash"] * 1024 * 1024 // HASH_ENTRY_BYTES
+        if self.options["Threads"] > 1:
+            searcher = ParallelSearch(self.game, self.options["Threads"], size)
+        else:
+            searcher = Search(self.game, TranspositionTable(size))
+        if self.options["BookFile"]:
+            searcher.book = chess_book.Book(self.options["BookFile"])
+        if self.options["TablebasePath"]:
+            searcher.tablebase = chess_tablebase.Tablebase(self.options["TablebasePath"])
+        return searcher
+
+    def _budget(self, limits: dict[str, int]) -> float | None:
+        """seconds for this move, None to search until another limit or stop"""
+        if "movetime" in limits:
+            return max(limits["movetime"] / 1000 - MOVE_OVERHEAD, 0.01)
+        white = self.game.current_team == "WHITE"
+        remaining = limits.get("wtime" if white else "btime")
+        if remaining is None:
+            return None
+        increment = limits.get("winc" if white else "binc", 0)
+        moves_to_go = limits.get("movestogo") or MOVES_TO_GO
+        budget = min(remaining / moves_to_go + increment * 0.75, remaining / 2) / 1000
+        return max(budget - MOVE_OVERHEAD, 0.01)
+
+    def _start_timer(self, budget: float):
+        #the search checks its stop flag on every node, so it returns within a few milliseconds of this
+        self._timer = threading.Timer(budget, self.searcher.stop)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _search(self, searcher: Search | ParallelSearch, depth: int | None, max_time: float | None, nodes: int | None):
+        result = searcher.search(depth, max_time, nodes, self._send_info)
+        if result.book:
+            self.send("info string book move")
+        if self._infinite:
+            self._stop_requested.wait()
+        self.send(f"bestmove {to_uci(result.best_move)}" if result.best_move is not None else "bestmove 0000")
+
+    def _send_info(self, result: SearchResult):
+        score = f"mate {result.mate_in}" if result.mate_in is not None else f"cp {result.score}"
+        pv = " ".join(to_uci(move) for move in result.pv)
+        self.send(
+            f"info depth {result.depth} seldepth {result.seldepth} score {score} nodes {result.nodes} "
+            f"nps {result.nps} time {int(result.seconds * 1000)} pv {pv}"
+        )
+
+    def _stop_search(self):
+        """Stops a running search and waits for its bestmove"""
+        if self._thread is None:
+            return
+        self._stop_requested.set()
+        #a search that had not started yet would clear a single stop, so keep asking
+        while self._thread.is_alive():
+            self.searcher.stop()
+            self._thread.join(0.01)
+        self._thread = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+def main():
+    UciEngine().run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import random
+from chess_pieces import Piece
+
+#fixed seed so keys (and anything stored with them) are the same on every run
+_random = random.Random(0x5EED_C4E55)
+
+def _key() -> int:
+    return _random.getrandbits(64)
+
+#[team][abbreviation][square index]
+PIECE_KEYS: dict[str, dict[str, list[int]]] = {
+    team: {abbreviation: [_key() for _ in range(64)] for abbreviation in Piece.Pieces}
+    for team in ("WHITE", "BLACK")
+}
+SIDE_KEY = _key() #black to move
+CASTLING_KEYS = [_key() for _ in range(16)] #by castling rights mask
+EN_PASSANT_KEYS = [_key() for _ in range(8)] #by file, 0 = A
+
+def piece_key(piece: Piece, sq: int) -> int:
+    keys = PIECE_KEYS[piece.team].get(piece.abbreviation)
+    if keys is None:
+        #piece type registered after this module was imported
+        keys = PIECE_KEYS[piece.team][piece.abbreviation] = [_key() for _ in range(64)]
+    return keys[sq]